@@ -12,7 +12,8 @@ revolve evolutionary simulation suite. The robot descriptions are printed out in
 format, which can these can be directly used in revolve experiments.
 
 It was built for simplicity of transportation, rather than maintenance,
-therefore it is a single monolithic file that includes all the required components to run.
+therefore the editor is a single monolithic file. The robot model it edits lives in the
+GUI-free 'devolve' package next to it, so robots can also be processed without a display.
 
 Requirements:
     $ pip install -r requirements.txt
@@ -24,7 +25,7 @@ Example:
     $ python Devolve.py
 
 TODO:
-- [ ] Undo/Redo
+- [x] Undo/Redo (ctrl+z / ctrl+y)
 - [ ] Remove adding blocks to side of hinges
 
 This code is provided 'As Is'.
@@ -34,27 +35,35 @@ This code is provided 'As Is'.
 # Thirdparty
 from ursina import *
 from ursina.prefabs.file_browser_save import FileBrowserSave
+from direct.showbase.ShowBase import ShowBase
+from panda3d.core import BamFile, BamWriter, Filename, Geom, GeomEnums, GeomNode
+from panda3d.core import GeomTriangles, GeomVertexData, GeomVertexFormat, NodePath
+from panda3d.core import ClockObject, LODNode, OmniBoundingVolume, Point2, Point3
+from panda3d.core import Texture
+from panda3d.core import Shader as PandaShader
+import numpy as np
 import yaml
 
-# =============================== Constants ===================================== #
-# Global Constants (Needed For Intellisense And Extendability)
-ID = "id"
-BODY = "body"
-TYPE = "type"
-PARAMS = "params"
-BLUE = "blue"
-GREEN = "green"
-RED = "red"
-ORIENTATION = "orientation"
-CHILDREN = "children"
-CORE = "CoreComponent"
-HINGE = "ActiveHinge"
-BRICK = "FixedBrick"
-
-"""string: module level constants, YAML headers definitions
-Needed for future proof, as the naming choice for Revolve is arbitrary
-"""
+# Standard
+import collections
+import concurrent.futures
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+# Local
+from devolve import yaml_io
+from devolve.constants import BRICK, CORE, HINGE, PART_COLORS
+from devolve.geometry import ATTACHMENTS
+from devolve.history import History, Restyle
+from devolve.serializer import Serializer
+from devolve.mesh import UV_CELLS, box_proxy, decimate
+from devolve.morphology import ROOT, Morphology, MorphologyError
+from devolve.picking import pick as pick_ray
 
+# =============================== Constants ===================================== #
 ASSETS = {
     CORE: "assets/core/core",
     BRICK: "assets/brick/brick",
@@ -64,38 +73,50 @@ ASSETS = {
 Dictionary that define path to model asssets
 """
 
-COLORS = {
-    0: {
-        CORE: Color(1, 1, 1, 1),  # White
-        BRICK: Color(1, 0.278, 0.122, 1),  # 1F47FF
-        HINGE: Color(0.439, 0, 1, 1),  # 94FF00
-    },
-    90: {
-        BRICK: Color(0, 0.706, 1, 1),  # 1F47FF
-        HINGE: Color(0, 1, 0.58, 1),  # FF0070
-    },
-}
-"""dict: module level constants
-Dictionary that defines color of different part types
+MESH_CACHE = "assets/cache"
+MESH_CACHE_VERSION = 1
+"""module level constants
+Folder of the binary (.bam) copies of the ASSETS, and version of their layout
 """
 
-CORE_CHILD_POS = {
-    0: (-1, 0, 0),
-    1: (1, 0, 0),
-    2: (0, -1, 0),
-    3: (0, 1, 0),
-}
+LOD_RATIOS = (1.0, 0.25, 0.0)
+LOD_DISTANCES = (12, 30)
+"""tuple: module level constants
+Fraction of the triangles kept by every level of detail (0 is a box proxy), and the
+camera distances at which a part switches to the next level
+"""
 
-CORE_CHILD_ROT = {
-    0: -90,
-    1: 90,
-    2: -180,
-    3: 0,
-}
+RENDER_ON_CHANGE = True
+IDLE_FPS = 10
+IDLE_FRAMES = 3
+"""module level constants
+Whether frames are only rendered when something changed, how often the editor checks
+for changes while idle, and how many frames it keeps rendering after the last change
+"""
+
+LOAD_BUDGET = 0.008
+"""float: module level constant
+Seconds per frame spent creating the Voxels of loaded robots
+"""
+
+POOL_SIZE = 4096
+POOL_RESERVE = 64
+"""int: module level constants
+Most unused Voxels kept for reuse per part type (high-water mark), and how many are
+built per part type when the editor starts
+"""
 
-CORE_CHILD_ORI = {0: (90, 0), 1: (-90, 0), 2: (0, 90), 3: (0, -90)}
+MODELS = {}
+"""dict: module level variable
+Levels of detail of the part types, filled from the mesh cache by preload_models()
+"""
+
+COLORS = {
+    orientation: {_type: Color(*rgb, 1) for _type, rgb in colors.items()}
+    for orientation, colors in PART_COLORS.items()
+}
 """dict: module level constants
-Dictionaries that define the position and rotation of the children of the core component
+Dictionary that defines color of different part types
 """
 
 VIEW = 1
@@ -103,11 +124,50 @@ VIEW = 1
 Variable that keeps track of the camera view
 """
 
-CORE_COUNT = 0
-HINGE_COUNT = 0
-BRICK_COUNT = 0
+robot = None
+"""Morphology: module level variable
+Headless description of the robot being edited, the Voxels only draw it
+"""
+
+renderer = None
+"""InstancedRenderer: module level variable
+Draws all the Voxels, one draw call per part type and orientation (a PlainRenderer on
+graphics drivers without instancing support)
+"""
+
+pool = None
+"""VoxelPool: module level variable
+Unused Voxels, every Voxel is taken from it and given back to it
+"""
+
+yaml_loader = None
+"""Loader: module level variable
+Loads YAML files over several frames, the robot must not be edited while it is busy
+"""
+
+idle = None
+"""RenderOnChange: module level variable
+Stops rendering while nothing changes, None when every frame is rendered
+"""
+
+history = None
+"""History: module level variable
+Undo/redo log of the edits of the robot, every edit goes through it
+"""
+
+serializer = None
+"""Serializer: module level variable
+Keeps the YAML text of the robot between saves, only the edited parts are written again
+"""
+
+voxels = {}
 """dict: module level variable
-Variables that keep track of quantity of different parts
+Voxel drawing every row of the robot, including the hidden ones that can be undone
+"""
+
+hovered = None
+"""int: module level variable
+Row of the part under the mouse, None if there is none
 """
 
 BRUSH = BRICK
@@ -116,228 +176,726 @@ ORI = 0
 Variables that enable different creation modes
 """
 
-# =============================== Ursina ===================================== #
-class Voxel(Button):
-    def __init__(self, parent, _type, position, orientation, idx):
-        part_model, part_color = self.get_model_info(_type, orientation)
-        super().__init__(
-            parent=parent,
-            position=position,
-            model=f"{part_model}.obj",
-            texture=f"{part_model}.jpg",
-            color=part_color,
-            highlight_color=color.lime,
+# =============================== Assets ===================================== #
+def asset_digest(part_model: str, level: int = 0) -> str:
+    """
+    Args:
+        part_model: Path of an asset, without extension
+        level: Level of detail, index into LOD_RATIOS
+
+    Returns: hash of the contents of the .obj/.mtl/.jpg files making up the asset and of
+    the decimation parameters of the level, so retuning them builds the level again
+    """
+    digest = hashlib.sha1(str(MESH_CACHE_VERSION).encode())
+    digest.update(repr((LOD_RATIOS[level], UV_CELLS)).encode())
+    for extension in (".obj", ".mtl", ".jpg"):
+        if os.path.exists(part_model + extension):
+            with open(part_model + extension, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def model_arrays(model: NodePath):
+    """
+    Args:
+        model: Model to read
+
+    Returns: (vertices, uvs, triangles) NumPy arrays of all the geometry of the model
+    """
+    # Copied under a parent, as the search skips the root (a GeomNode for arrays_model)
+    root = NodePath("model")
+    model.copyTo(root)
+    root.flattenStrong()
+    vertices, uvs, triangles = [], [], []
+    for geom_node in root.findAllMatches("**/+GeomNode"):
+        for geom in geom_node.node().getGeoms():
+            vdata = geom.getVertexData().convertTo(GeomVertexFormat.getV3t2())
+            rows = np.frombuffer(memoryview(vdata.getArray(0)), dtype=np.float32)
+            rows = rows.reshape(-1, 5)
+            offset = sum(len(v) for v in vertices)
+            for primitive in geom.getPrimitives():
+                indices = np.array(
+                    primitive.decompose().getVertexList(), dtype=np.int32
+                )
+                triangles.append(indices.reshape(-1, 3) + offset)
+            vertices.append(rows[:, :3])
+            uvs.append(rows[:, 3:])
+    return np.concatenate(vertices), np.concatenate(uvs), np.concatenate(triangles)
+
+
+def arrays_model(name: str, vertices, uvs, triangles) -> NodePath:
+    """
+    Args:
+        name: Name of the new model
+        vertices: (n, 3) vertex positions
+        uvs: (n, 2) texture coordinates
+        triangles: (m, 3) vertex indices
+
+    Returns: a model made of the given triangles
+    """
+    vdata = GeomVertexData(name, GeomVertexFormat.getV3t2(), Geom.UHStatic)
+    vdata.uncleanSetNumRows(len(vertices))
+    rows = np.ascontiguousarray(np.concatenate([vertices, uvs], axis=1), np.float32)
+    vdata.modifyArrayHandle(0).copyDataFrom(rows)
+
+    primitive = GeomTriangles(Geom.UHStatic)
+    primitive.setIndexType(GeomEnums.NT_uint32)
+    indices = primitive.modifyVertices()
+    indices.uncleanSetNumRows(triangles.size)
+    indices.modifyHandle().copyDataFrom(np.ascontiguousarray(triangles, np.uint32))
+
+    geom = Geom(vdata)
+    geom.addPrimitive(primitive)
+    node = GeomNode(name)
+    node.addGeom(geom)
+    return NodePath(node)
+
+
+def cache_path(part_model: str, level: int = 0) -> str:
+    """Returns: path of the binary copy of a level of detail of an asset in MESH_CACHE"""
+    name = os.path.basename(part_model)
+    digest = asset_digest(part_model, level)
+    return os.path.join(MESH_CACHE, f"{name}-{digest}-lod{level}.bam")
+
+
+def cached_model(part_model: str, level: int = 0) -> NodePath:
+    """
+    Loads a level of detail of an asset from its binary copy in MESH_CACHE, building the
+    copy from the .obj/.jpg files the first time (or after they changed).
+
+    Args:
+        part_model: Path of an asset, without extension
+        level: Level of detail, index into LOD_RATIOS
+
+    Returns: the textured model
+    """
+    name = os.path.basename(part_model)
+    bam = cache_path(part_model, level)
+    if os.path.exists(bam):
+        return loader.loadModel(Filename.fromOsSpecific(bam), noCache=True)
+
+    if level == 0:
+        model = loader.loadModel(Filename.fromOsSpecific(f"{part_model}.obj"))
+        texture = loader.loadTexture(Filename.fromOsSpecific(f"{part_model}.jpg"))
+    else:
+        full = cached_model(part_model)
+        vertices, uvs, triangles = model_arrays(full)
+        if LOD_RATIOS[level] > 0:
+            mesh = decimate(vertices, uvs, triangles, LOD_RATIOS[level])
+        else:
+            mesh = box_proxy(vertices)
+        model = arrays_model(f"{name}_lod{level}", *mesh)
+        texture = full.getTexture()
+    model.setTexture(texture, 1)
+
+    # Store the texture pixels in the .bam as well, so no JPEG decoding is needed
+    os.makedirs(MESH_CACHE, exist_ok=True)
+    bam_file = BamFile()
+    if bam_file.openWrite(Filename.fromOsSpecific(bam)):
+        bam_file.getWriter().setFileTextureMode(BamWriter.BTM_rawdata)
+        bam_file.writeObject(model.node())
+        bam_file.close()
+    return model
+
+
+def preload_models() -> None:
+    """Fills MODELS with the levels of detail of every part type"""
+    for _type, part_model in ASSETS.items():
+        MODELS[_type] = [cached_model(part_model, i) for i in range(len(LOD_RATIOS))]
+
+
+def check_mesh_cache() -> int:
+    """
+    Builds every level of detail of the ASSETS into an empty mesh cache, as on a fresh
+    checkout, and loads them back from it. Needs no window:
+        $ python Devolve.py --check-cache
+
+    Returns: number of levels that could not be built or came back different
+    """
+    global MESH_CACHE
+    cache = MESH_CACHE
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        MESH_CACHE = directory
+        try:
+            for _type, part_model in ASSETS.items():
+                for level in range(len(LOD_RATIOS)):
+                    try:
+                        built = model_arrays(cached_model(part_model, level))
+                        if not os.path.exists(cache_path(part_model, level)):
+                            raise OSError("the .bam file was not written")
+                        loaded = model_arrays(cached_model(part_model, level))
+                        if not all(map(np.array_equal, built, loaded)):
+                            raise ValueError("the .bam file holds other geometry")
+                    except Exception as error:
+                        failures += 1
+                        sys.stderr.write(f"FAILED {_type} lod{level}: {error}\n")
+                        continue
+                    sys.stdout.write(
+                        f"--- {_type} lod{level}: {len(built[2])} triangles\n"
+                    )
+        finally:
+            MESH_CACHE = cache
+    return failures
+
+
+# =============================== Rendering ===================================== #
+INSTANCE_SHADER = PandaShader.make(
+    PandaShader.SL_GLSL,
+    vertex="""
+#version 140
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform samplerBuffer instances;
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+out vec2 uv;
+out vec4 tint;
+
+void main() {
+    // Every instance owns 5 texels: 4 rows of its transform and its tint
+    int base = gl_InstanceID * 5;
+    mat4 transform = mat4(
+        texelFetch(instances, base),
+        texelFetch(instances, base + 1),
+        texelFetch(instances, base + 2),
+        texelFetch(instances, base + 3)
+    );
+    tint = texelFetch(instances, base + 4);
+    uv = p3d_MultiTexCoord0;
+    gl_Position = p3d_ModelViewProjectionMatrix * transform * p3d_Vertex;
+}
+""",
+    fragment="""
+#version 140
+uniform sampler2D p3d_Texture0;
+in vec2 uv;
+in vec4 tint;
+out vec4 fragment_color;
+
+void main() {
+    fragment_color = texture(p3d_Texture0, uv) * tint;
+}
+""",
+)
+"""Shader: module level constant
+GLSL program that places and tints every instance of a part from a buffer texture
+"""
+
+
+class InstanceLevel(Entity):
+    """One level of detail of an InstanceGroup, drawn with a single instanced call"""
+
+    def __init__(self, model, capacity=64, **kwargs):
+        super().__init__(model=model.copyTo(NodePath()), **kwargs)
+        self.data = np.zeros((capacity, 5, 4), dtype=np.float32)
+        self.buffer = Texture(f"{self.name}_instances")
+        self.buffer.setup_buffer_texture(
+            capacity * 5, Texture.T_float, Texture.F_rgba32, GeomEnums.UH_dynamic
         )
-        self.idx = idx
-        self._type = _type
-        self.orientation = orientation
-        self.color = part_color
-        global CORE_COUNT, BRICK_COUNT, HINGE_COUNT
-        if _type == CORE:
-            CORE_COUNT += 1
-        elif _type == BRICK:
-            BRICK_COUNT += 1
-        elif _type == HINGE:
-            HINGE_COUNT += 1
-        self.as_dict = self.get_as_dict()
-
-    def get_model_info(self, _type, orientation):
-        return ASSETS[_type], COLORS[orientation][_type]
-
-    def get_type_count(self, _type):
-        global CORE_COUNT, BRICK_COUNT, HINGE_COUNT
-        if _type == CORE:
-            return CORE_COUNT
-        elif _type == BRICK:
-            return BRICK_COUNT
-        elif _type == HINGE:
-            return HINGE_COUNT
-
-    def get_as_dict(self):
+        self.setShader(INSTANCE_SHADER, 1)
+        self.setShaderInput("instances", self.buffer)
+        # Instances are spread over the whole robot, never cull on the model bounds
+        self.node().setBounds(OmniBoundingVolume())
+        self.node().setFinal(True)
+        self.setInstanceCount(0)
+
+    def upload(self, instances) -> None:
+        if len(instances) > len(self.data):
+            self.data = np.zeros((2 * len(instances), 5, 4), dtype=np.float32)
+            self.buffer.setup_buffer_texture(
+                len(self.data) * 5,
+                Texture.T_float,
+                Texture.F_rgba32,
+                GeomEnums.UH_dynamic,
+            )
+        self.data[: len(instances)] = instances
+        self.buffer.setRamImage(self.data.tobytes())
+        self.setInstanceCount(len(instances))
+
+
+class InstanceGroup(Entity):
+    """All the parts of one type and orientation, split over their levels of detail"""
+
+    def __init__(self, _type, orientation, capacity=64, **kwargs):
+        super().__init__(**kwargs)
+        self.voxels = []
+        self.rows = {}
+        self.dirty = set()
+        self.data = np.zeros((capacity, 5, 4), dtype=np.float32)
+        self.levels = [InstanceLevel(model, parent=self) for model in MODELS[_type]]
+
+    def add(self, voxel) -> None:
+        if len(self.voxels) == len(self.data):
+            data = np.zeros((2 * len(self.data), 5, 4), dtype=np.float32)
+            data[: len(self.data)] = self.data
+            self.data = data
+        self.rows[voxel] = len(self.voxels)
+        self.voxels.append(voxel)
+        self.dirty.add(voxel)
+
+    def remove(self, voxel) -> None:
+        # Swap the last instance into the freed row, so removal is O(1)
+        row = self.rows.pop(voxel)
+        last = self.voxels.pop()
+        if last is not voxel:
+            self.voxels[row] = last
+            self.rows[last] = row
+            self.data[row] = self.data[len(self.voxels)]
+        self.dirty.discard(voxel)
+        self.dirty.add(None)
+
+    def set_tint(self, voxel, tint) -> None:
+        if voxel in self.rows:
+            self.data[self.rows[voxel], 4] = tuple(tint)
+            self.dirty.add(None)
+
+    def flush(self, eye) -> None:
         """
+        Reads the instances that changed since the last frame and hands every instance
+        to the level of detail matching its distance to the camera.
+
         Args:
-            _id: Identifier of part, arbitrary
-            _type: Type of component to return, categorical = {C, H, B}
-            orientation: Rotation of component, categorical = {0, 90}
-            b: Blue component of part color, range = [0-1]
-            g: Green component of part color, range = [0-1]
-            r: Red component of part color, range = [0-1]
-
-        Returns: dictionary with correctly formatted keys for YAML file
+            eye: Position of the camera, relative to the group
         """
-        # Generate Id
-        _id = f"{self._type}{self.orientation}_{self.get_type_count(self._type)}"
-
-        # Build Part
-        part = {}
-        part[ID] = _id
-        part[TYPE] = self._type
-        part[ORIENTATION] = self.orientation
-        part[PARAMS] = {}
-        part[PARAMS][RED] = self.color[0]
-        part[PARAMS][GREEN] = self.color[1]
-        part[PARAMS][BLUE] = self.color[2]
-        return part
+        for voxel in self.dirty:
+            if voxel is None:
+                continue
+            mat = voxel.getMat(self)
+            self.data[self.rows[voxel], :4] = [tuple(mat.getRow(i)) for i in range(4)]
+            self.data[self.rows[voxel], 4] = tuple(voxel.color)
+        self.dirty.clear()
+
+        instances = self.data[: len(self.voxels)]
+        distance = np.linalg.norm(instances[:, 3, :3] - tuple(eye), axis=1)
+        level = np.searchsorted(LOD_DISTANCES, distance)
+        for i, lod in enumerate(self.levels):
+            lod.upload(instances[level == i])
+
+
+class InstancedRenderer(Entity):
+    """Draws the Voxels of the scene with one draw call per part type, orientation and
+    level of detail
+
+    The Voxels themselves have no model nor collider, they only carry the transform of a
+    part; the renderer reads their transforms and uploads them to the GPU in bulk.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.groups = {}
+        self.eye = None
+
+    def group(self, voxel) -> InstanceGroup:
+        key = (voxel._type, voxel.orientation)
+        if key not in self.groups:
+            self.groups[key] = InstanceGroup(*key, parent=self)
+        return self.groups[key]
+
+    def add(self, voxel) -> None:
+        self.group(voxel).add(voxel)
+
+    def remove(self, voxel) -> None:
+        self.group(voxel).remove(voxel)
+
+    def set_tint(self, voxel, tint) -> None:
+        self.group(voxel).set_tint(voxel, tint)
+
+    def update(self):
+        # Levels of detail only need to be picked again when the camera moved
+        eye = camera.getPos(self)
+        moved = eye != self.eye
+        self.eye = eye
+        for group in self.groups.values():
+            if group.dirty or moved:
+                group.flush(eye)
+                if idle is not None:
+                    idle.wake()
+
+
+class PlainRenderer:
+    """Draws every Voxel with its own copy of the part model, for graphics drivers that
+    cannot run INSTANCE_SHADER (e.g. the OpenGL 2.1 compatibility profile of macOS)
+
+    Same interface as the InstancedRenderer: every Voxel gets a holder node, tinted by its
+    color scale (on the holder, so child Voxels do not inherit it), under which a shared
+    level of detail switch of its part type is instanced.
+    """
+
+    def __init__(self) -> None:
+        self.models = {}
+        self.instances = {}
+
+    def model(self, _type) -> NodePath:
+        if _type not in self.models:
+            lod = NodePath(LODNode(f"{_type}_lod"))
+            switches = (0,) + LOD_DISTANCES + (1e9,)
+            for i, level in enumerate(MODELS[_type]):
+                lod.node().addSwitch(switches[i + 1], switches[i])
+                level.copyTo(lod)
+            self.models[_type] = lod
+        return self.models[_type]
+
+    def add(self, voxel) -> None:
+        holder = voxel.attachNewNode("model")
+        holder.setColorScale(voxel.color)
+        self.model(voxel._type).instanceTo(holder)
+        self.instances[voxel] = holder
+        if idle is not None:
+            idle.wake()
+
+    def remove(self, voxel) -> None:
+        self.instances.pop(voxel).removeNode()
+        if idle is not None:
+            idle.wake()
+
+    def set_tint(self, voxel, tint) -> None:
+        if voxel in self.instances:
+            self.instances[voxel].setColorScale(tint)
+            if idle is not None:
+                idle.wake()
+
+
+def supports_instancing() -> bool:
+    """Returns: whether the graphics driver can run INSTANCE_SHADER (GLSL 1.40, buffer
+    textures and instanced draw calls)"""
+    gsg = base.win.getGsg()
+    version = (gsg.getDriverShaderVersionMajor(), gsg.getDriverShaderVersionMinor())
+    return (
+        gsg.getSupportsGlsl()
+        and gsg.getSupportsBufferTexture()
+        and gsg.getSupportsGeometryInstancing()
+        and version >= (1, 40)
+    )
+
+
+class RenderOnChange(Entity):
+    """Renders frames only when the camera moved, the mouse moved, a key or button was
+    pressed, the window was resized or the parts changed
+
+    In between the window is not drawn and the main loop is throttled to IDLE_FPS, so an
+    idle editor barely uses the CPU. Any change renders at full rate again right away.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.clock = ClockObject.getGlobalClock()
+        self.state = None
+        self.frames = IDLE_FRAMES
+        self.active = True
+
+    def wake(self) -> None:
+        """Renders the next IDLE_FRAMES frames"""
+        self.frames = IDLE_FRAMES
+        if not self.active:
+            self.active = True
+            base.win.setActive(True)
+            self.clock.setMode(ClockObject.MNormal)
 
     def input(self, key):
-        if self.hovered:
-            if key == "left mouse down":
-                if self._type == CORE:
-                    idx = pos_2_dir(mouse.normal, core=True)
-                    if idx == None:
-                        pass
-                    else:
-                        voxel = Voxel(
-                            parent=self,
-                            _type=BRUSH,
-                            position=mouse.normal,
-                            orientation=ORI,
-                            idx=idx,
-                        )
-                        voxel.rotation_z = CORE_CHILD_ROT[idx]
-                        if ORI == 90:
-                            voxel.rotation_x, voxel.rotation_y = CORE_CHILD_ORI[idx]
-                else:
-                    idx = pos_2_dir(mouse.normal)
-                    if idx == None:
-                        pass
-                    else:
-                        voxel = Voxel(
-                            parent=self,
-                            _type=BRUSH,
-                            position=mouse.normal,
-                            orientation=ORI,
-                            idx=idx,
-                        )
-                        voxel.rotation_z = dir_2_rot(idx)
-                        if ORI == 90:
-                            voxel.rotation_x, voxel.rotation_y = dir_2_ori(idx)
-
-            if key == "right mouse down" and self._type != CORE:
-                destroy(self)
-
-
-def pos_2_dir(pos, core: bool = False):
-    if core:
-        if pos == (-1, 0, 0):
-            return 0
-        elif pos == (1, 0, 0):
-            return 1
-        elif pos == (0, -1, 0):
-            return 2
-        elif pos == (0, 1, 0):
-            return 3
-        else:
-            return None
-    else:
-        if pos == (-1, 0, 0):
-            return 3
-        elif pos == (1, 0, 0):
-            return 2
-        elif pos == (0, -1, 0):
-            return 0
-        elif pos == (0, 1, 0):
-            return 1
-        else:
-            return None
-
-
-def dir_2_pos(direction):
-    if direction == 3:
-        return (-1, 0, 0)
-    elif direction == 2:
-        return (1, 0, 0)
-    elif direction == 0:
-        return (0, -1, 0)
-    elif direction == 1:
-        return (0, 1, 0)
-    else:
-        return None
+        self.wake()
 
+    def update(self):
+        state = (
+            camera.getMat(scene),
+            tuple(mouse.position),
+            tuple(window.size),
+        )
+        if state != self.state:
+            self.state = state
+            self.wake()
+        elif self.frames > 0:
+            self.frames -= 1
+        elif self.active:
+            self.active = False
+            base.win.setActive(False)
+            self.clock.setMode(ClockObject.MLimited)
+            self.clock.setFrameRate(IDLE_FPS)
 
-def dir_2_rot(direction):
-    if direction == 0:
-        return -180
-    elif direction == 1:
-        return
-    elif direction == 2:
-        return 90
-    elif direction == 3:
-        return -90
-    else:
-        return None
 
+# =============================== Ursina ===================================== #
+class Voxel(Entity):
+    def __init__(self, **kwargs):
+        super().__init__(enabled=False, **kwargs)
+        self.part = None
+
+    def bind(self, parent, part, position) -> None:
+        """Makes the Voxel draw a part of the robot, Voxels are reused by the VoxelPool"""
+        self.parent = parent
+        self.position = position
+        self.rotation = (0, 0, 0)
+        self.part = part
+        self.idx = int(robot.slot[part])
+        self._type = robot.type_name(part)
+        self.orientation = int(robot.orientation[part])
+        self.color = COLORS[self.orientation][self._type]
+        self.enabled = True
+        voxels[part] = self
+        renderer.add(self)
+
+    @property
+    def as_dict(self):
+        return robot.part_dict(self.part)
+
+
+class VoxelPool:
+    """Disabled Voxels waiting to draw a part, one list per part type
+
+    Placing a part takes a Voxel from the pool of its type and parts that can never come
+    back give theirs back, so editing and reloading reuse the same Panda3D nodes instead
+    of creating and destroying them. Voxels beyond the high-water mark are destroyed.
+
+    Attributes:
+        size: Most Voxels kept per part type
+        free: Part type -> unused Voxels
+    """
 
-def dir_2_ori(direction):
-    if direction == 1:
-        return 0, -90
-    elif direction == 2:
-        return -90, 0
-    elif direction == 3:
-        return 90, 0
-    else:
-        return None
+    def __init__(self, size: int = POOL_SIZE) -> None:
+        self.size = size
+        self.free = {_type: [] for _type in ASSETS}
 
+    def reserve(self, count: int) -> None:
+        """Builds Voxels until every part type has count of them ready"""
+        for free in self.free.values():
+            while len(free) < min(count, self.size):
+                free.append(Voxel())
 
-def recursive_draw_parts(data, voxel):
-    try:
-        keys = data[CHILDREN].keys()
-    except KeyError:
+    def take(self, parent, part, position) -> Voxel:
+        """
+        Args:
+            parent: Entity to attach the Voxel to
+            part: Row of the part in the robot Morphology
+            position: Position relative to the parent
+
+        Returns: a Voxel drawing the part
+        """
+        free = self.free[robot.type_name(part)]
+        voxel = free.pop() if free else Voxel()
+        voxel.bind(parent, part, position)
+        return voxel
+
+    def give(self, voxel) -> None:
+        """Takes back the Voxel of a part that is no longer drawn"""
+        free = self.free[voxel._type]
+        voxel.part = None
+        if len(free) < self.size:
+            voxel.enabled = False
+            voxel.parent = scene
+            free.append(voxel)
+        else:
+            destroy(voxel)
+
+
+# =============================== Input ===================================== #
+def pick():
+    """
+    Casts the mouse ray through the lattice of the robot, the parts have no colliders
+
+    Returns: (row of the part under the mouse, slot of the face it points at or None),
+    None when the mouse is not over a part
+    """
+    if mouse.hovered_entity is not None:  # Over the menus, which keep their colliders
+        return None
+    near, far = Point3(), Point3()
+    screen = Point2(mouse.x * 2 / window.aspect_ratio, mouse.y * 2)
+    camera.lens.extrude(screen, near, far)
+    origin = core.getRelativePoint(camera, near)
+    direction = core.getRelativeVector(camera, far - near)
+    return pick_ray(robot, origin, direction)
+
+
+def update():
+    # Tint the part under the mouse
+    global hovered
+    hit = pick()
+    row = None if hit is None else hit[0]
+    if row != hovered:
+        if hovered in voxels:
+            renderer.set_tint(voxels[hovered], voxels[hovered].color)
+        if row in voxels:  # Parts being loaded can have no Voxel yet
+            renderer.set_tint(voxels[row], color.lime)
+        hovered = row
+
+
+def click(key) -> None:
+    """Edits the part under the mouse, left click adds a part and right click removes"""
+    hit = pick()
+    if hit is None or yaml_loader.busy:
         return
-    for child_idx in keys:
-        _type = data[CHILDREN][child_idx][TYPE]
-        child = Voxel(
-            parent=voxel,
-            _type=_type,
-            position=dir_2_pos(child_idx),
-            orientation=data[CHILDREN][child_idx][ORIENTATION],
-            idx=child_idx,
-        )
-        child.rotation_z = dir_2_rot(child_idx)
-        if data[CHILDREN][child_idx][ORIENTATION] == 90:
-            child.rotation_x, child.rotation_y = dir_2_ori(child_idx)
+    part, slot = hit
+    if key == "left mouse down":
+        if slot is not None and robot.can_attach(part, slot):
+            edit = history.add_part(part, slot, BRUSH, ORI)
+            draw_part(voxels[part], edit.roots[0])
+    elif part != ROOT:
+        show_edit(history.remove_subtree(part), False)
+
+
+def input(key):
+    # The only input handler of the scene, the Voxels have none
+    if key in ("left mouse down", "right mouse down"):
+        click(key)
+    elif key == "z" and held_keys["control"]:
+        # Ursina strips the modifiers from the key names, they are read from held_keys
+        if held_keys["shift"]:
+            redo()
+        else:
+            undo()
+    elif key == "y" and held_keys["control"]:
+        redo()
 
-        try:
-            recursive_draw_parts(data[CHILDREN][child_idx], child)
-        except KeyError:
-            pass
 
+def show_edit(edit, present: bool) -> None:
+    """
+    Shows or hides the Voxels of an edit, they are kept around (disabled) while the edit
+    can still be undone, so undo/redo never rebuilds the scene
 
-def yaml_2_scene(data: dict) -> None:
+    Args:
+        edit: Edit recorded by the History
+        present: Whether the rows of the edit are now part of the robot
     """
-    Adds YAML file contents to scene
+    for row in edit.rows.tolist():
+        if present:
+            renderer.add(voxels[row])
+        else:
+            renderer.remove(voxels[row])
+    for root in edit.roots:
+        voxels[root].enabled = present
+
+
+def restyle_voxels(rows) -> None:
+    """Gives the Voxels of parts whose type changed in place their new look"""
+    for row in rows.tolist():
+        voxel = voxels[row]
+        renderer.remove(voxel)
+        voxel._type = robot.type_name(row)
+        voxel.color = COLORS[voxel.orientation][voxel._type]
+        renderer.add(voxel)
+
+
+def show_changes(changes) -> None:
+    """Shows the changes undone or redone by the History"""
+    for change, present in changes:
+        if isinstance(change, Restyle):
+            restyle_voxels(change.rows)
+        else:
+            show_edit(change, present)
+
+
+def drop_voxels(edit) -> None:
+    """Gives the Voxels of an edit that can no longer be undone back to the pool"""
+    # Children first, so no Voxel is destroyed together with its parent
+    for row in reversed(edit.rows.tolist()):
+        voxel = voxels.pop(row, None)
+        if voxel is not None:
+            pool.give(voxel)
+
+
+def undo() -> None:
+    if not yaml_loader.busy:
+        show_changes(history.undo())
+
+
+def redo() -> None:
+    if not yaml_loader.busy:
+        show_changes(history.redo())
+
+
+def draw_part(voxel, part):
     """
-    # Draw core component
-    core_data = data[BODY]
-    _type = core_data[TYPE]
-    global core
-
-    for child_idx in core_data[CHILDREN].keys():
-        _type = core_data[CHILDREN][child_idx][TYPE]
-        child = Voxel(
-            parent=core,
-            _type=_type,
-            position=CORE_CHILD_POS[child_idx],
-            orientation=core_data[CHILDREN][child_idx][ORIENTATION],
-            idx=child_idx,
-        )
-        child.rotation_z = CORE_CHILD_ROT[child_idx]
-        if core_data[CHILDREN][child_idx][ORIENTATION] == 90:
-            child.rotation_x, child.rotation_y = CORE_CHILD_ORI[child_idx]
+    Args:
+        voxel: Voxel of the parent part
+        part: Row of the part in the robot Morphology
 
-        recursive_draw_parts(core_data[CHILDREN][child_idx], child)
+    Returns: the Voxel drawing the part
+    """
+    key = voxel._type, int(robot.slot[part]), int(robot.orientation[part])
+    attachment = ATTACHMENTS[key]
+    child = pool.take(voxel, part, attachment.offset)
+    child.rotation = attachment.euler
+    return child
 
 
-def yaml_read(yaml_path: str) -> dict:
+def read_robot(paths) -> Morphology:
     """
     Args:
-        yaml_in: name of YAML file to read
+        paths: YAML files to read
 
-    Returns: A dictionary containing the contents of the YAML file
+    Returns: one robot with the parts of all the files attached to its core, files that
+    can not be read are skipped
     """
-    with open(yaml_path) as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
-    return data
+    merged = Morphology()
+    for path in paths:
+        sys.stdout.write(f"--- {path}\n")
+        try:
+            merged.merge(yaml_io.read_morphology(path))
+        except (MorphologyError, yaml.YAMLError, OSError) as error:
+            sys.stdout.write(f"--- Skipped, {error}\n")
+    return merged
+
+
+class Loader(Entity):
+    """Loads YAML files without freezing the editor
+
+    A worker thread parses the files into one Morphology while the editor keeps running.
+    The robot being edited is then turned into it by History.reload, which only removes,
+    restyles and adds the parts that differ, and the Voxels of the added parts are
+    created (parents first) over the next frames, until LOAD_BUDGET seconds are spent in
+    every frame. A line of text shows the progress meanwhile.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.worker = concurrent.futures.ThreadPoolExecutor(1)
+        self.future = None
+        self.parts = collections.deque()
+        self.count = 0
+        self.drawn = 0
+        self.label = Text("", parent=camera.ui, y=0.45, origin=(0, 0), enabled=False)
+
+    @property
+    def busy(self) -> bool:
+        return self.future is not None or bool(self.parts)
+
+    def load(self, paths) -> None:
+        sys.stdout.write("======= STARTING YAML LOADING =======\n")
+        self.future = self.worker.submit(read_robot, paths)
+        self.count = self.drawn = 0
+        self.label.text = f"Loading {len(paths)} files"
+        self.label.enabled = True
+
+    def reload(self) -> None:
+        """Turns the robot into the loaded one, and queues the Voxels of the new parts"""
+        try:
+            loaded = self.future.result()
+        finally:
+            self.future = None  # Never stay busy, even if the worker failed
+        removal, restyle, addition = history.reload(loaded)
+        show_edit(removal, False)
+        restyle_voxels(restyle.rows)
+        self.parts.extend((voxels[int(robot.parent[r])], r) for r in addition.roots)
+        self.count = len(addition.rows)
+
+    def update(self):
+        if not self.busy:
+            return
+        if self.future is not None and self.future.done():
+            self.reload()
+        deadline = time.perf_counter() + LOAD_BUDGET
+        while self.parts and time.perf_counter() < deadline:
+            voxel, part = self.parts.popleft()
+            child = draw_part(voxel, part)
+            self.parts.extend((child, c) for _, c in robot.child_items(part))
+            self.drawn += 1
+
+        if self.busy:
+            if self.future is None:
+                self.label.text = f"Loading: {self.drawn}/{self.count} parts drawn"
+            if idle is not None:
+                idle.wake()
+        else:
+            self.label.enabled = False
+            sys.stdout.write("======= ENDING YAML LOADING =======\n")
+            sys.stdout.flush()
 
 
 def engine_setup() -> None:
@@ -347,7 +905,8 @@ def engine_setup() -> None:
     window.borderless = False  # Show a border
     window.fullscreen = False  # Do not go Fullscreen
     window.exit_button.visible = False  # Hide in-game red X that loses the window
-    window.fps_counter.enabled = True  # Show the FPS (Frames per second) counter
+    # Show the FPS (Frames per second) counter, meaningless when idle frames are skipped
+    window.fps_counter.enabled = not RENDER_ON_CHANGE
 
     # Enable movable camera
     # Key-bindings:
@@ -357,6 +916,9 @@ def engine_setup() -> None:
     global ec
     ec = EditorCamera()
 
+    # Load the part models before the first one is placed
+    preload_models()
+
 
 class MenuButton(Button):
     def __init__(self, text="", **kwargs):
@@ -371,47 +933,26 @@ class MenuButton(Button):
 def function_menu() -> None:
     """ """
 
-    def yaml_construct_recusrive(voxel, data):
-        children = voxel.children
-        if len(children) > 0:
-            data[CHILDREN] = {}
-            for child in children:
-                data[CHILDREN][child.idx] = child.as_dict
-                data[CHILDREN][child.idx] = yaml_construct_recusrive(
-                    child, data[CHILDREN][child.idx]
-                )
-        return data
-
     def save_yaml() -> None:
         """ """
         wp = FileBrowserSave(file_type=".yaml")
-
-        global core
-        data = yaml_construct_recusrive(core, core.as_dict)
-        yaml_out = {ID: "robot", BODY: data}
-        wp.data = yaml.dump(yaml_out, sort_keys=False)
+        robot.renumber()  # Same ids whatever the editing history
+        wp.data = serializer.dump()
 
     def load_yaml() -> None:
         """ """
         fb = FileBrowser(file_types=("*.yaml"), enabled=True)
 
         def on_submit(paths):
-            sys.stdout.write("======= STARTING YAML LOADING =======\n")
-            clear_canvas()
-            for p in paths:
-                sys.stdout.write(f"--- {p}\n")
-                data = yaml_read(p)  # Get YAML data
-                yaml_2_scene(data)  # Render YAMl data
-            sys.stdout.write("======= ENDING YAML LOADING =======\n")
-            sys.stdout.flush()
+            if not yaml_loader.busy:
+                yaml_loader.load(paths)
 
         fb.on_submit = on_submit
 
     def clear_canvas() -> None:
         """ """
-        global core
-        for child in core.children:
-            destroy(child)
+        if not yaml_loader.busy:
+            show_edit(history.clear(), False)
 
     def change_view() -> None:
         """ """
@@ -439,6 +980,8 @@ def function_menu() -> None:
         MenuButton("Save YAML", on_click=save_yaml),
         MenuButton("Load YAML", on_click=load_yaml),
         MenuButton("Clear Canvas", on_click=clear_canvas),
+        MenuButton("Undo", on_click=undo),
+        MenuButton("Redo", on_click=redo),
         MenuButton("Change View", on_click=change_view),
     ]
     for i, e in enumerate(menu_parent.buttons):
@@ -490,11 +1033,27 @@ def main() -> None:
     brush_menu()
 
     # Initialize world with "core" component
-    global core
-    core = Voxel(parent=scene, _type=CORE, position=(0, 0, 0), orientation=0, idx=None)
+    global core, robot, renderer, history, serializer, idle, yaml_loader, pool
+    robot = Morphology()
+    history = History(robot, on_drop=drop_voxels)
+    serializer = Serializer(robot)
+    if supports_instancing():
+        renderer = InstancedRenderer(parent=scene)
+    else:
+        renderer = PlainRenderer()
+    if RENDER_ON_CHANGE:
+        idle = RenderOnChange()
+    pool = VoxelPool()
+    pool.reserve(POOL_RESERVE)
+    core = pool.take(scene, ROOT, (0, 0, 0))
+    yaml_loader = Loader()
 
 
 if __name__ == "__main__":
+    if "--check-cache" in sys.argv:
+        ShowBase(windowType="none")
+        sys.exit(1 if check_mesh_cache() else 0)
+
     # Initialise your Ursina app
     app = Ursina()
 
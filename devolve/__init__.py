@@ -0,0 +1,7 @@
+""" Headless Devolve
+
+GUI-free building blocks shared by the Devolve editor (Devolve.py) and the batch tools.
+Nothing in this package imports Ursina or Panda3D.
+"""
+
+from devolve.morphology import Morphology, MorphologyError
@@ -0,0 +1,5 @@
+import sys
+
+from devolve.cli import main
+
+sys.exit(main())
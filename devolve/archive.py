@@ -0,0 +1,393 @@
+""" Binary robot archives
+
+Packs any number of robots into one file of fixed-width records, with an offset index at
+the end, so a population can be opened with mmap and single robots (or just their node
+arrays) read without parsing the rest.
+
+Layout (little endian):
+    HEADER                              magic, version, number of robots, index offset
+    for every robot:
+        RECORD                          number of nodes and colors, text lengths
+        name                            robot id as a YAML scalar, utf-8
+        extra                           other top level YAML sections (e.g. the brain)
+        COLOR * colors                  palette
+        NODE * nodes                    parts in pre-order, the core first
+    uint64 * (robots + 1)               offset of every robot, then of the index itself
+
+Converting YAML -> archive -> YAML gives back the file batch normalization would write:
+same body, colors and extra sections, part ids renumbered in pre-order.
+
+Example:
+    $ python -m devolve pack data_fullevolution/phenotypes -o population.dva
+    $ python -m devolve unpack population.dva -o phenotypes
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+
+# Thirdparty
+import numpy as np
+import yaml
+
+# Local
+from devolve import yaml_io
+from devolve.batch import CHUNKSIZE, iter_paths
+from devolve.constants import BODY, ID
+from devolve.morphology import NONE, ROOT, Morphology, MorphologyError
+
+# =============================== Constants ===================================== #
+MAGIC = b"DEVOLVEA"
+VERSION = 1
+"""module level constants
+Identify the archive format
+"""
+
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("reserved", "<u4"),
+        ("count", "<u8"),
+        ("index", "<u8"),
+    ]
+)
+RECORD = np.dtype(
+    [("nodes", "<u4"), ("colors", "<u2"), ("name", "<u2"), ("extra", "<u4")]
+)
+NODE = np.dtype(
+    [
+        ("parent", "<i4"),
+        ("slot", "u1"),
+        ("type", "u1"),
+        ("orientation", "u1"),
+        ("color", "<u2"),
+    ]
+)
+COLOR = np.dtype([("rgb", "<f8", (3,)), ("ints", "u1")])
+"""np.dtype: module level constants
+Packed records of the format. The parent of a node is its index in the robot (NONE for
+the core), bit i of COLOR.ints says whether channel i was written as an integer.
+"""
+
+
+# =============================== Encoding ===================================== #
+def encode(morphology: Morphology, extra=None) -> bytes:
+    """
+    Args:
+        morphology: Robot to pack
+        extra: Other top level sections of its YAML file, if any
+
+    Returns: the archive record of the robot
+    """
+    m = morphology
+    order = np.array(m.subtree(ROOT))
+    index = np.full(m.size, NONE, dtype=np.int64)
+    index[order] = np.arange(len(order))
+
+    nodes = np.zeros(len(order), dtype=NODE)
+    parent = m.parent[order]
+    nodes["parent"] = np.where(parent == NONE, NONE, index[parent])
+    nodes["slot"] = m.slot[order]
+    nodes["type"] = m.part_type[order]
+    nodes["orientation"] = m.orientation[order]
+    nodes["color"] = m.color[order]
+
+    palette = np.zeros(len(m.palette), dtype=COLOR)
+    for i, rgb in enumerate(m.palette):
+        if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in rgb):
+            raise MorphologyError(f"Invalid color: {rgb!r}")
+        palette[i]["rgb"] = rgb
+        palette[i]["ints"] = sum(
+            1 << c for c, v in enumerate(rgb) if isinstance(v, int)
+        )
+
+    name = yaml_io.dump_scalar(m.name).encode()
+    extra = yaml_io.dump(extra).encode() if extra else b""
+    record = np.array([(len(nodes), len(palette), len(name), len(extra))], RECORD)
+    return b"".join((record.tobytes(), name, extra, palette.tobytes(), nodes.tobytes()))
+
+
+def views(buffer, offset: int = 0) -> tuple:
+    """
+    Args:
+        buffer: Bytes or mmap holding the record
+        offset: Position of the record in the buffer
+
+    Returns: (name, extra, palette, nodes) of the record, all views on the buffer
+    """
+    record = np.frombuffer(buffer, RECORD, 1, offset).copy()[0]
+    nodes, colors, name, extra = (int(record[field]) for field in RECORD.names)
+    start = offset + RECORD.itemsize
+    name = memoryview(buffer)[start : start + name]
+    start += len(name)
+    extra = memoryview(buffer)[start : start + extra]
+    start += len(extra)
+    palette = np.frombuffer(buffer, COLOR, colors, start)
+    nodes = np.frombuffer(buffer, NODE, nodes, start + palette.nbytes)
+    return name, extra, palette, nodes
+
+
+def decode(buffer, offset: int = 0) -> tuple:
+    """
+    Args:
+        buffer: Bytes or mmap holding the record
+        offset: Position of the record in the buffer
+
+    Returns: (name, extra sections, palette, nodes), the arrays are views on the buffer
+    """
+    name, extra, palette, nodes = views(buffer, offset)
+    name = yaml_io.load_scalar(bytes(name))
+    extra = yaml_io.load(bytes(extra)) if len(extra) else {}
+    return name, extra, palette, nodes
+
+
+def to_morphology(name, palette, nodes) -> Morphology:
+    """
+    Args:
+        name: Robot id
+        palette: COLOR records
+        nodes: NODE records, in pre-order
+
+    Returns: the robot, validated like a YAML file would be
+    """
+    colors = [
+        tuple(
+            int(v) if record["ints"] >> c & 1 else float(v)
+            for c, v in enumerate(record["rgb"])
+        )
+        for record in palette
+    ]
+    return Morphology.from_arrays(
+        name,
+        nodes["parent"],
+        nodes["slot"],
+        nodes["type"],
+        nodes["orientation"],
+        nodes["color"],
+        colors,
+    )
+
+
+def split_yaml(data: dict) -> tuple:
+    """
+    Args:
+        data: Contents of a robot YAML file
+
+    Returns: (Morphology, other top level sections)
+    """
+    if not isinstance(data, dict):
+        raise MorphologyError(
+            f"Malformed robot file: {type(data).__name__} at top level"
+        )
+    extra = {key: value for key, value in data.items() if key not in (ID, BODY)}
+    return Morphology.from_dict(data), extra
+
+
+def join_yaml(morphology: Morphology, extra: dict) -> dict:
+    """Inverse of split_yaml"""
+    data = morphology.to_dict()
+    data.update(extra)
+    return data
+
+
+# =============================== Archive ===================================== #
+class ArchiveWriter:
+    """Appends robot records to an archive file
+
+    Example:
+        >>> with ArchiveWriter("population.dva") as archive:
+        ...     archive.add(robot)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "wb")
+        self.offsets = [HEADER.itemsize]
+        self.file.write(bytes(HEADER.itemsize))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def write(self, record: bytes) -> None:
+        """Appends a record made by encode()"""
+        self.file.write(record)
+        self.offsets.append(self.offsets[-1] + len(record))
+
+    def add(self, morphology: Morphology, extra=None) -> None:
+        self.write(encode(morphology, extra))
+
+    def close(self) -> None:
+        if self.file.closed:
+            return
+        self.file.write(np.array(self.offsets, dtype="<u8").tobytes())
+        header = np.array([(MAGIC, VERSION, 0, len(self), self.offsets[-1])], HEADER)
+        self.file.seek(0)
+        self.file.write(header.tobytes())
+        self.file.close()
+
+
+class Archive:
+    """Read only, memory mapped view of an archive file
+
+    Only the header and the index are read when opening, robots are decoded on access.
+    Arrays returned by nodes() and palette() are views on the file, they must not
+    outlive the Archive.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = np.frombuffer(self.mmap, HEADER, 1).copy()[0]
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} Devolve archive")
+        count = int(header["count"])
+        self.offsets = np.frombuffer(self.mmap, "<u8", count + 1, int(header["index"]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Morphology:
+        return self.morphology(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.morphology(i)
+
+    def record(self, i: int) -> tuple:
+        """Returns: (name, extra sections, palette, nodes) of robot i, see decode()"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Robot {i} out of range")
+        return decode(self.mmap, int(self.offsets[i]))
+
+    def nodes(self, i: int) -> np.array:
+        """Returns: NODE records of robot i, read straight from the file"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Robot {i} out of range")
+        return views(self.mmap, int(self.offsets[i]))[3]
+
+    def name(self, i: int):
+        """Returns: id of robot i, without decoding the rest of its record"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"Robot {i} out of range")
+        name = views(self.mmap, int(self.offsets[i]))[0]
+        return yaml_io.load_scalar(bytes(name))
+
+    def morphology(self, i: int) -> Morphology:
+        name, _, palette, nodes = self.record(i)
+        return to_morphology(name, palette, nodes)
+
+    def to_dict(self, i: int) -> dict:
+        """Returns: contents of the YAML file of robot i"""
+        name, extra, palette, nodes = self.record(i)
+        return join_yaml(to_morphology(name, palette, nodes), extra)
+
+    def close(self) -> None:
+        self.offsets = np.zeros(1, dtype="<u8")
+        self.mmap.close()
+        self.file.close()
+
+
+# =============================== Command line ===================================== #
+def pack_file(path: str) -> tuple:
+    """
+    Args:
+        path: YAML file of a robot
+
+    Returns: (path, archive record or None, error message or None)
+    """
+    try:
+        return path, encode(*split_yaml(yaml_io.yaml_read(path))), None
+    except (MorphologyError, yaml.YAMLError, OSError) as error:
+        return path, None, f"{type(error).__name__}: {error}"
+
+
+def pack(target: str, output: str, jobs=None, chunksize: int = CHUNKSIZE) -> dict:
+    """
+    Args:
+        target: Directory or glob pattern of the YAML files
+        output: Archive to write
+        jobs: Number of worker processes, defaults to the number of cores
+        chunksize: Number of files handed to a worker at once
+
+    Returns: summary with the number of robots, bytes, failures and the elapsed time
+    """
+    summary = {"files": 0, "bytes": 0, "failures": [], "seconds": 0.0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool, ArchiveWriter(output) as archive:
+        for path, record, error in pool.imap(pack_file, iter_paths(target), chunksize):
+            summary["files"] += 1
+            if error is not None:
+                summary["failures"].append((path, error))
+            else:
+                archive.write(record)
+    summary["bytes"] = os.path.getsize(output)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def unpack(path: str, output: str) -> int:
+    """
+    Args:
+        path: Archive to read
+        output: Folder for the YAML files, named after the position of the robots
+
+    Returns: number of robots written
+    """
+    os.makedirs(output, exist_ok=True)
+    with Archive(path) as archive:
+        width = len(str(len(archive)))
+        for i in range(len(archive)):
+            with open(os.path.join(output, f"{i:0{width}d}.yaml"), "w") as f:
+                yaml_io.dump(archive.to_dict(i), f)
+        return len(archive)
+
+
+def main_pack(args) -> int:
+    """Entry point of `python -m devolve pack`"""
+    summary = pack(args.target, args.output, args.jobs, args.chunksize)
+    for path, error in summary["failures"]:
+        sys.stderr.write(f"FAILED {path}: {error}\n")
+    packed = summary["files"] - len(summary["failures"])
+    sys.stdout.write(
+        f"{packed} robots ({len(summary['failures'])} failed) packed in "
+        f"{summary['bytes']} bytes, {summary['seconds']:.2f} s\n"
+    )
+    return 1 if summary["failures"] else 0
+
+
+def main_unpack(args) -> int:
+    """Entry point of `python -m devolve unpack`"""
+    sys.stdout.write(f"{unpack(args.archive, args.output)} robots unpacked\n")
+    return 0
+
+
+def add_parser(subparsers) -> None:
+    parser = subparsers.add_parser("pack", help="pack robot YAML files into an archive")
+    parser.add_argument("target", help="directory or glob pattern of YAML files")
+    parser.add_argument("-o", "--output", required=True, help="archive to write")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (all cores)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.set_defaults(func=main_pack)
+
+    parser = subparsers.add_parser("unpack", help="write an archive back as YAML files")
+    parser.add_argument("archive", help="archive to read")
+    parser.add_argument("-o", "--output", required=True, help="folder for the YAML")
+    parser.set_defaults(func=main_unpack)
@@ -0,0 +1,155 @@
+""" Batch processing of phenotype directories
+
+Parses, validates, renumbers and re-emits every robot description of a directory (or
+glob) with a pool of worker processes, without ever importing Ursina.
+
+Example:
+    $ python -m devolve batch data_fullevolution/phenotypes --output normalized
+    $ python -m devolve batch "experiments/**/phenotype_*.yaml" --jobs 8
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+# Thirdparty
+import yaml
+
+# Local
+from devolve import yaml_io
+from devolve.constants import BODY, ID
+from devolve.morphology import Morphology, MorphologyError
+
+# =============================== Constants ===================================== #
+CHUNKSIZE = 64
+"""int: module level constant
+Number of files handed to a worker at once
+"""
+
+
+# =============================== Functions ===================================== #
+def iter_paths(target: str):
+    """
+    Args:
+        target: Directory (searched recursively for .yaml files) or glob pattern
+
+    Yields: paths of the YAML files, lazily
+    """
+    if os.path.isdir(target):
+        for root, dirs, files in os.walk(target):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith((".yaml", ".yml")):
+                    yield os.path.join(root, name)
+    else:
+        yield from glob.iglob(target, recursive=True)
+
+
+def input_root(target: str) -> str:
+    """
+    Args:
+        target: Directory or glob pattern of the YAML files
+
+    Returns: folder the output paths are made relative to
+    """
+    if os.path.isdir(target):
+        return target
+    parts = []
+    for part in target.split(os.sep):
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    root = os.sep.join(parts)
+    return root if os.path.isdir(root) else os.path.dirname(root) or "."
+
+
+def normalize(data: dict) -> tuple:
+    """
+    Args:
+        data: Contents of a robot YAML file
+
+    Returns: (normalized contents, number of parts), the body is validated and its ids
+    renumbered, other top level sections are kept as they are
+    """
+    morphology = Morphology.from_dict(data)
+    out = morphology.to_dict()
+    for key, value in data.items():
+        if key not in (ID, BODY):
+            out[key] = value
+    return out, len(morphology)
+
+
+def process(job: tuple) -> tuple:
+    """
+    Args:
+        job: (path of the YAML file, output folder or None, root of the input)
+
+    Returns: (path, number of parts, error message or None)
+    """
+    path, output, root = job
+    try:
+        data, parts = normalize(yaml_io.yaml_read(path))
+        if output is not None:
+            out_path = os.path.join(output, os.path.relpath(path, root))
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "w") as f:
+                yaml_io.dump(data, f)
+    except (MorphologyError, yaml.YAMLError, OSError) as error:
+        return path, 0, f"{type(error).__name__}: {error}"
+    return path, parts, None
+
+
+def run_batch(target: str, output=None, jobs=None, chunksize: int = CHUNKSIZE) -> dict:
+    """
+    Args:
+        target: Directory or glob pattern of the YAML files
+        output: Folder to write the normalized files to, None to only validate
+        jobs: Number of worker processes, defaults to the number of cores
+        chunksize: Number of files handed to a worker at once
+
+    Returns: summary with the number of files, parts, failures and the elapsed time
+    """
+    root = input_root(target)
+    stream = ((path, output, root) for path in iter_paths(target))
+
+    summary = {"files": 0, "parts": 0, "failures": [], "seconds": 0.0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool:
+        for path, parts, error in pool.imap_unordered(process, stream, chunksize):
+            summary["files"] += 1
+            summary["parts"] += parts
+            if error is not None:
+                summary["failures"].append((path, error))
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main(args) -> int:
+    """Entry point of `python -m devolve batch`"""
+    summary = run_batch(args.target, args.output, args.jobs, args.chunksize)
+    for path, error in summary["failures"]:
+        sys.stderr.write(f"FAILED {path}: {error}\n")
+
+    seconds = max(summary["seconds"], 1e-9)
+    sys.stdout.write(
+        f"{summary['files']} files ({len(summary['failures'])} failed), "
+        f"{summary['parts']} parts in {seconds:.2f} s: "
+        f"{summary['files'] / seconds:.0f} files/s, "
+        f"{summary['parts'] / seconds:.0f} parts/s\n"
+    )
+    return 1 if summary["failures"] else 0
+
+
+def add_parser(subparsers) -> None:
+    parser = subparsers.add_parser(
+        "batch", help="validate and normalize a directory of robot YAML files"
+    )
+    parser.add_argument("target", help="directory or glob pattern of YAML files")
+    parser.add_argument("-o", "--output", help="folder for the normalized files")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (all cores)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.set_defaults(func=main)
@@ -0,0 +1,115 @@
+""" YAML ingest and kinematics benchmark
+
+Compares the loaders on robot descriptions, by default the phenotypes shipped with the
+documentation (unzip docs/files/phenotypes.zip in the home directory first), then times
+the batched forward kinematics on a population made of copies of them.
+
+Example:
+    $ python -m devolve.benchmark
+    $ python -m devolve.benchmark phenotypes/*.yaml --repeat 500 --population 10000
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import argparse
+import sys
+import time
+
+# Thirdparty
+import yaml
+
+# Local
+from devolve import yaml_io
+from devolve.kinematics import Population
+
+# =============================== Constants ===================================== #
+PHENOTYPES = ("phenotypes/phenotype_228.yaml", "phenotypes/tardigrade.yaml")
+"""tuple: module level constant
+Files benchmarked when none are given
+"""
+
+LOADERS = {
+    "FullLoader": lambda text: yaml.load(text, Loader=yaml.FullLoader),
+    yaml_io.SafeLoader.__name__: lambda text: yaml.load(
+        text, Loader=yaml_io.SafeLoader
+    ),
+    "BodyLoader": yaml_io.load,
+}
+"""dict: module level constant
+Loaders to compare, the first one is the baseline (what Devolve used to call)
+"""
+
+
+def time_loader(load, text: str, repeat: int) -> float:
+    """
+    Args:
+        load: Function parsing YAML text
+        text: YAML text to parse
+        repeat: Number of times to parse it
+
+    Returns: average seconds per parse
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        load(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def yaml_benchmark(paths, repeat: int = 200) -> list:
+    """
+    Args:
+        paths: YAML files to parse
+        repeat: Number of times every file is parsed by every loader
+
+    Returns: (path, loader, seconds per parse, speedup over the baseline) rows
+    """
+    rows = []
+    for path in paths:
+        with open(path) as f:
+            text = f.read()
+        baseline = None
+        for name, load in LOADERS.items():
+            seconds = time_loader(load, text, repeat)
+            baseline = baseline or seconds
+            rows.append((path, name, seconds, baseline / seconds))
+    return rows
+
+
+def kinematics_benchmark(paths, population: int = 100000) -> tuple:
+    """
+    Args:
+        paths: YAML files of the robots to copy
+        population: Number of robots to place at once
+
+    Returns: (number of parts, seconds to place them and check them for overlaps)
+    """
+    morphologies = [yaml_io.read_morphology(path) for path in paths]
+    stack = Population([morphologies[i % len(paths)] for i in range(population)])
+    start = time.perf_counter()
+    position, _ = stack.forward()
+    stack.overlapping(position)
+    return int(stack.alive.sum()), time.perf_counter() - start
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=PHENOTYPES)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--population", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    sys.stdout.write(f"libyaml: {yaml_io.LIBYAML}\n")
+    for path, name, seconds, speedup in yaml_benchmark(args.paths, args.repeat):
+        sys.stdout.write(
+            f"{path:40} {name:12} {seconds * 1e6:9.1f} us {speedup:6.1f}x\n"
+        )
+
+    parts, seconds = kinematics_benchmark(args.paths, args.population)
+    sys.stdout.write(
+        f"kinematics: {parts} parts in {seconds:.3f} s, "
+        f"{parts / seconds / 1e6:.1f} M parts/s\n"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+""" Canonical form and structural hash of robots
+
+Two robot files describe the same robot when one can be turned into the other by a
+symmetry of the core (quarter turns about its vertical axis, flipping it over, mirror
+images) and by renaming slots whose parts end up in the same place (e.g. a brick with
+orientation 90 and its children moved to the matching slots).
+
+The canonical form therefore only looks at geometry: for every part its lattice cell, the
+cell of its parent, its type and, for hinges, the (unsigned) direction of the hinge axis.
+These rows are written for each of the 16 symmetries of the core and the smallest sorted
+encoding is kept, so the form, and its hash, are the same for all equivalent robots.
+
+Flipping the core over gives the same robot, but not the same body under gravity: the
+body hash only uses the 8 symmetries that keep the core upright, so robots with the same
+body hash behave the same in a physics simulation.
+
+Example:
+    $ python -m devolve dedup data_fullevolution/phenotypes --json duplicates.json
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import hashlib
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+
+# Thirdparty
+import numpy as np
+import yaml
+
+# Local
+from devolve import yaml_io
+from devolve.batch import CHUNKSIZE, iter_paths
+from devolve.constants import HINGE, TYPE_INDEX
+from devolve.geometry import ROTATIONS
+from devolve.morphology import NONE, ROOT, Morphology, MorphologyError
+
+# =============================== Constants ===================================== #
+SYMMETRIES = np.array(
+    [
+        (
+            [[a, 0, 0], [0, b, 0], [0, 0, c]]
+            if not swap
+            else [[0, a, 0], [b, 0, 0], [0, 0, c]]
+        )
+        for swap in (False, True)
+        for a, b, c in itertools.product((1, -1), repeat=3)
+    ],
+    dtype=np.int32,
+)
+"""np.array: module level constant
+(16, 3, 3) symmetries of the core: the signed permutations of x and y, times flipping z
+"""
+
+UPRIGHT = SYMMETRIES[SYMMETRIES[:, 2, 2] == 1]
+"""np.array: module level constant
+(8, 3, 3) symmetries of the core that do not flip z, a body is the same under gravity
+"""
+
+HASH_SIZE = 16
+"""int: module level constant
+Bytes of the structural hash
+"""
+
+
+# =============================== Functions ===================================== #
+def canonical_form(morphology: Morphology, symmetries=SYMMETRIES) -> bytes:
+    """
+    Args:
+        morphology: Robot to describe
+        symmetries: Symmetries of the core under which robots are equivalent
+
+    Returns: encoding of the robot that is equal for all robots equivalent to it
+    """
+    m = morphology
+    rows = np.array(m.subtree(ROOT))
+    parent = m.parent[rows]
+    cell = m.position[rows].astype(np.int32)
+    parent_cell = m.position[np.where(parent == NONE, ROOT, parent)].astype(np.int32)
+    hinge = m.part_type[rows] == TYPE_INDEX[HINGE]
+    axis = ROTATIONS[m.rotation[rows], :, 0].astype(np.int32) * hinge[:, None]
+    part_type = m.part_type[rows, None].astype(np.int32)
+
+    best = None
+    for symmetry in symmetries:
+        table = np.hstack(
+            (
+                cell @ symmetry.T,
+                parent_cell @ symmetry.T,
+                part_type,
+                np.abs(axis @ symmetry.T),
+            )
+        ).astype("<i4")
+        table = table[np.lexsort(table.T[::-1])]
+        form = table.tobytes()
+        if best is None or form < best:
+            best = form
+    return best
+
+
+def structural_hash(morphology: Morphology) -> str:
+    """
+    Args:
+        morphology: Robot to hash
+
+    Returns: hex digest of the canonical form, the same for all equivalent robots
+    """
+    return hashlib.blake2b(
+        canonical_form(morphology), digest_size=HASH_SIZE
+    ).hexdigest()
+
+
+def body_hash(morphology: Morphology) -> str:
+    """
+    Args:
+        morphology: Robot to hash
+
+    Returns: hex digest of the canonical form under the UPRIGHT symmetries, the same for
+    all robots that are the same body under gravity (never equal to a structural hash)
+    """
+    return hashlib.blake2b(
+        canonical_form(morphology, UPRIGHT), digest_size=HASH_SIZE, person=b"upright"
+    ).hexdigest()
+
+
+def hash_file(path: str, hasher=structural_hash) -> tuple:
+    """
+    Args:
+        path: YAML file of a robot
+        hasher: Hash function of a Morphology
+
+    Returns: (path, hash or None, error message or None)
+    """
+    try:
+        return path, hasher(yaml_io.read_morphology(path)), None
+    except (MorphologyError, yaml.YAMLError, OSError) as error:
+        return path, None, f"{type(error).__name__}: {error}"
+
+
+def find_duplicates(target: str, jobs=None, chunksize: int = CHUNKSIZE) -> dict:
+    """
+    Args:
+        target: Directory or glob pattern of the YAML files
+        jobs: Number of worker processes, defaults to the number of cores
+        chunksize: Number of files handed to a worker at once
+
+    Returns: summary with the files of every hash, the failures and the elapsed time
+    """
+    summary = {"files": 0, "hashes": {}, "failures": [], "seconds": 0.0}
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool:
+        for path, digest, error in pool.imap(hash_file, iter_paths(target), chunksize):
+            summary["files"] += 1
+            if error is not None:
+                summary["failures"].append((path, error))
+            else:
+                summary["hashes"].setdefault(digest, []).append(path)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def main(args) -> int:
+    """Entry point of `python -m devolve dedup`"""
+    summary = find_duplicates(args.target, args.jobs, args.chunksize)
+    for path, error in summary["failures"]:
+        sys.stderr.write(f"FAILED {path}: {error}\n")
+
+    duplicates = {h: paths for h, paths in summary["hashes"].items() if len(paths) > 1}
+    for digest, paths in duplicates.items():
+        sys.stdout.write(f"{digest}\n")
+        for path in paths:
+            sys.stdout.write(f"    {path}\n")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary["hashes"], f, indent=2)
+
+    sys.stdout.write(
+        f"{summary['files']} files ({len(summary['failures'])} failed), "
+        f"{len(summary['hashes'])} distinct robots, "
+        f"{sum(len(p) - 1 for p in duplicates.values())} duplicates "
+        f"in {summary['seconds']:.2f} s\n"
+    )
+    return 1 if summary["failures"] else 0
+
+
+def add_parser(subparsers) -> None:
+    parser = subparsers.add_parser(
+        "dedup", help="find robot YAML files that describe the same robot"
+    )
+    parser.add_argument("target", help="directory or glob pattern of YAML files")
+    parser.add_argument("--json", help="write the files of every hash to this file")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (all cores)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.set_defaults(func=main)
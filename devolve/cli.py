@@ -0,0 +1,35 @@
+""" Command line interface of the headless tools
+
+Example:
+    $ python -m devolve --help
+    $ python -m devolve batch phenotypes
+    $ python -m devolve pack phenotypes -o population.dva
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import argparse
+import sys
+
+# Local
+from devolve import archive, batch, canonical, descriptors, evaluate
+
+COMMANDS = (batch, archive, canonical, descriptors, evaluate)
+"""tuple: module level constant
+Modules providing a sub-command, each one has an add_parser(subparsers) function
+"""
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="devolve", description="Headless tools for Devolve/Revolve robots"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in COMMANDS:
+        command.add_parser(subparsers)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+""" Constants shared by the editor and the headless tools
+
+Everything in here is free of Ursina/Panda3D so that it can be imported on
+machines without a display.
+"""
+
+# =============================== YAML Schema ===================================== #
+ID = "id"
+BODY = "body"
+TYPE = "type"
+PARAMS = "params"
+BLUE = "blue"
+GREEN = "green"
+RED = "red"
+ORIENTATION = "orientation"
+CHILDREN = "children"
+CORE = "CoreComponent"
+HINGE = "ActiveHinge"
+BRICK = "FixedBrick"
+"""string: module level constants, YAML headers definitions
+Needed for future proof, as the naming choice for Revolve is arbitrary
+"""
+
+# =============================== Parts ===================================== #
+PART_TYPES = (CORE, BRICK, HINGE)
+"""tuple: module level constant
+Part types in the order used by the integer `part_type` codes of a Morphology
+"""
+
+TYPE_INDEX = {name: code for code, name in enumerate(PART_TYPES)}
+"""dict: module level constant
+Inverse of PART_TYPES, maps a part type name to its integer code
+"""
+
+ORIENTATIONS = (0, 90)
+"""tuple: module level constant
+Orientations (in degrees) a part can be attached with
+"""
+
+SLOTS = 4
+"""int: module level constant
+Number of attachment slots of a part (the core uses all four, other parts use 0 as their
+attachment to the parent)
+"""
+
+PART_COLORS = {
+    0: {
+        CORE: (1.0, 1.0, 1.0),  # White
+        BRICK: (1.0, 0.278, 0.122),  # 1F47FF
+        HINGE: (0.439, 0.0, 1.0),  # 94FF00
+    },
+    90: {
+        BRICK: (0.0, 0.706, 1.0),  # 1F47FF
+        HINGE: (0.0, 1.0, 0.58),  # FF0070
+    },
+}
+"""dict: module level constant
+Default RGB color of the different part types, indexed by orientation then type
+"""
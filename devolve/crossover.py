@@ -0,0 +1,115 @@
+""" Subtree crossover on populations of genomes
+
+Recombines pairs of robots by replacing a random subtree of the first parent (the one the
+offspring is built on) with a random subtree of the second, for all the pairs of a batch
+at once. Nothing is deep-copied: the subtrees are boolean masks over the stacked node
+arrays of devolve.genomes, the offspring are gathered from the parents' arrays with one
+index array and the parent links remapped with another.
+
+Offspring are checked for overlapping parts with the batched kinematics before they are
+returned, the ones that clash are replaced by a copy of their first parent.
+
+Example:
+    >>> rng = np.random.default_rng(42)
+    >>> pairs = rng.integers(len(genomes), size=(2, 10_000))
+    >>> offspring, crossed = crossover(genomes.take(pairs[0]), genomes.take(pairs[1]), rng)
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.genomes import Genomes
+from devolve.morphology import NONE
+from devolve.mutation import random_parts
+
+
+# =============================== Functions ===================================== #
+def graft(mothers: Genomes, fathers: Genomes, cut, donor) -> Genomes:
+    """
+    Args:
+        mothers: Robots the offspring are built on
+        fathers: Robots giving a subtree, same number and palette as the mothers
+        cut: Stacked index in mothers of the root of the subtree to replace, NONE to
+            keep the robot as it is
+        donor: Stacked index in fathers of the root of the subtree put in its place,
+            ignored where cut is NONE
+
+    Returns: the offspring, which can overlap
+    """
+    cut = np.asarray(cut, dtype=np.int64)
+    crossed = cut != NONE
+    cut, donor = cut[crossed], np.asarray(donor, dtype=np.int64)[crossed]
+    kept = np.flatnonzero(~mothers.subtree_mask(cut))
+    given = np.flatnonzero(fathers.subtree_mask(donor))
+
+    # Offspring nodes: what is left of the mother, then the donated subtree
+    owner = np.concatenate((mothers.owner[kept], fathers.owner[given]))
+    order = np.argsort(owner, kind="stable")
+    new_index = np.empty(len(order), dtype=np.int64)
+    new_index[order] = np.arange(len(order))
+    mother_index = np.full(len(mothers.parent), NONE, dtype=np.int64)
+    mother_index[kept] = new_index[: len(kept)]
+    father_index = np.full(len(fathers.parent), NONE, dtype=np.int64)
+    father_index[given] = new_index[len(kept) :]
+
+    # Parent links, the donated roots hang from the parent of the part they replace
+    mother_parent = mothers.global_parent()
+    father_parent = fathers.global_parent()[given]
+    slot = np.concatenate((mothers.slot[kept], fathers.slot[given]))
+    parent = np.concatenate(
+        (
+            np.where(
+                mother_parent[kept] == NONE, NONE, mother_index[mother_parent[kept]]
+            ),
+            father_index[father_parent],
+        )
+    )
+    root = len(kept) + np.searchsorted(given, donor)
+    parent[root] = mother_index[mother_parent[cut]]
+    slot[root] = mothers.slot[cut]
+
+    sizes = np.bincount(owner, minlength=len(mothers))
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    parent = parent[order]
+    owner = owner[order]
+    return Genomes(
+        offsets,
+        np.where(parent == NONE, NONE, parent - offsets[owner]),
+        slot[order],
+        np.concatenate((mothers.part_type[kept], fathers.part_type[given]))[order],
+        np.concatenate((mothers.orientation[kept], fathers.orientation[given]))[order],
+        np.concatenate((mothers.color[kept], fathers.color[given]))[order],
+        mothers.palette,
+        mothers.names,
+    )
+
+
+def crossover(mothers: Genomes, fathers: Genomes, rng) -> tuple:
+    """
+    Args:
+        mothers: Robots the offspring are built on
+        fathers: Robots giving a subtree, same number and palette as the mothers
+        rng: NumPy random generator
+
+    Returns: (offspring, mask of the robots that were crossed), offspring that would
+    have overlapping parts, and mothers or fathers that are only a core, are copies of
+    the mother
+    """
+    if len(mothers) != len(fathers):
+        raise ValueError("Crossover needs as many mothers as fathers")
+    if mothers.palette is not fathers.palette:
+        raise ValueError("Only Genomes sharing a palette can be crossed")
+    cut = random_parts(mothers, rng)
+    donor = random_parts(fathers, rng)
+    cut[donor == NONE] = NONE
+    offspring = graft(mothers, fathers, cut, donor)
+
+    crossed = (cut != NONE) & ~offspring.overlapping()
+    if crossed.all():
+        return offspring, crossed
+    robots = np.arange(len(mothers))
+    both = Genomes.concatenate([offspring, mothers])
+    return both.take(np.where(crossed, robots, robots + len(mothers))), crossed
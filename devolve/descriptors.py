@@ -0,0 +1,266 @@
+""" Morphological descriptors of robot populations
+
+Computes Revolve style measures of many robots in one NumPy pass over a kinematics
+Population (no recursion over the trees, no per robot Python loop):
+
+    parts, bricks, hinges       number of parts of every kind (the core counts as a part)
+    length, width, height       size of the bounding box along x, y and z, in cells
+    joints                      hinges / parts
+    branching                   parts with every slot taken / (parts - 1) // 3
+    limbs                       parts without children / most limbs a robot this size has
+    length_of_limbs             parts with exactly one child (not the core) / (parts - 2)
+    coverage                    parts / volume of the bounding box
+    proportion                  shortest / longest side of the bounding box in the xy plane
+    symmetry                    share of parts whose mirror image across the x = 0 or the
+                                y = 0 plane is a part of the same type, the best plane
+
+Ratios whose denominator is 0 are 0.
+
+Example:
+    $ python -m devolve describe data_fullevolution/phenotypes -o descriptors.csv
+    $ python -m devolve describe population.dva -o descriptors.csv
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import csv
+import itertools
+import multiprocessing
+import sys
+import time
+
+# Thirdparty
+import numpy as np
+import yaml
+
+# Local
+from devolve import yaml_io
+from devolve.archive import MAGIC, Archive
+from devolve.batch import CHUNKSIZE, iter_paths
+from devolve.constants import BRICK, CORE, HINGE, SLOTS, TYPE_INDEX
+from devolve.kinematics import Population
+from devolve.morphology import NONE, MorphologyError
+
+# =============================== Constants ===================================== #
+DESCRIPTOR = np.dtype(
+    [
+        ("parts", "<i4"),
+        ("bricks", "<i4"),
+        ("hinges", "<i4"),
+        ("length", "<i4"),
+        ("width", "<i4"),
+        ("height", "<i4"),
+        ("joints", "<f8"),
+        ("branching", "<f8"),
+        ("limbs", "<f8"),
+        ("length_of_limbs", "<f8"),
+        ("coverage", "<f8"),
+        ("proportion", "<f8"),
+        ("symmetry", "<f8"),
+    ]
+)
+"""np.dtype: module level constant
+Descriptors of one robot, see the module docstring
+"""
+
+ARCHIVE_CHUNK = 4096
+"""int: module level constant
+Number of archived robots described at once
+"""
+
+
+# =============================== Descriptors ===================================== #
+def _ratio(numerator, denominator) -> np.array:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def max_limbs(parts) -> np.array:
+    """Returns: most parts without children a robot with this many parts can have"""
+    parts = np.asarray(parts, dtype=np.int64)
+    extra = np.maximum(parts - 6, 0)
+    return np.where(parts < 6, parts - 1, 2 * (extra // 3) + extra % 3 + 4)
+
+
+def symmetry(owner, part_type, position, count: int) -> np.array:
+    """
+    Args:
+        owner: Robot of every part
+        part_type: Type of every part
+        position: Lattice cell of every part
+        count: Number of robots
+
+    Returns: (count,) share of the parts off the mirror plane whose mirror image is a
+    part of the same type, for the best of the x = 0 and y = 0 planes
+    """
+    best = np.zeros(count)
+    parts = np.column_stack((owner, part_type, position)).astype(np.int64)
+    for axis in (0, 1):
+        mirrored = parts.copy()
+        mirrored[:, 2 + axis] *= -1
+        _, inverse = np.unique(
+            np.vstack((parts, mirrored)), axis=0, return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        original, reflected = inverse[: len(parts)], inverse[len(parts) :]
+        off_plane = position[:, axis] != 0
+        hit = np.isin(reflected, original) & off_plane
+        score = _ratio(
+            np.bincount(owner, hit, count), np.bincount(owner, off_plane, count)
+        )
+        np.maximum(best, score, out=best)
+    return best
+
+
+def describe(population: Population, position=None) -> np.array:
+    """
+    Args:
+        population: Robots to describe
+        position: Cells returned by population.forward(), computed if not given
+
+    Returns: (len(population),) DESCRIPTOR records
+    """
+    if position is None:
+        position, _ = population.forward()
+    count = len(population)
+    alive = population.alive
+    owner = population.owner[alive]
+    part_type = population.part_type[alive]
+    position = position[alive]
+    children = (population.children[alive] != NONE).sum(axis=1)
+    core = part_type == TYPE_INDEX[CORE]
+
+    out = np.zeros(count, dtype=DESCRIPTOR)
+    parts = np.bincount(owner, minlength=count)
+    out["parts"] = parts
+    out["bricks"] = np.bincount(owner, part_type == TYPE_INDEX[BRICK], count)
+    out["hinges"] = np.bincount(owner, part_type == TYPE_INDEX[HINGE], count)
+
+    # Parts are grouped by robot and every robot has its core
+    starts = np.searchsorted(owner, np.arange(count))
+    extent = (
+        np.maximum.reduceat(position, starts)
+        - np.minimum.reduceat(position, starts)
+        + 1
+    )
+    out["length"], out["width"], out["height"] = extent.T
+
+    full = children == np.where(core, SLOTS, SLOTS - 1)
+    leaf = (children == 0) & ~core
+    chain = (children == 1) & ~core
+    out["joints"] = _ratio(out["hinges"], parts)
+    out["branching"] = _ratio(np.bincount(owner, full, count), (parts - 1) // 3)
+    out["limbs"] = _ratio(np.bincount(owner, leaf, count), max_limbs(parts))
+    out["length_of_limbs"] = _ratio(np.bincount(owner, chain, count), parts - 2)
+    out["coverage"] = _ratio(parts, extent.prod(axis=1))
+    out["proportion"] = _ratio(extent[:, :2].min(axis=1), extent[:, :2].max(axis=1))
+    out["symmetry"] = symmetry(owner, part_type, position, count)
+    return out
+
+
+# =============================== Command line ===================================== #
+def describe_files(paths: list) -> tuple:
+    """
+    Args:
+        paths: YAML files of robots
+
+    Returns: (rows of the CSV, failures as (path, error message))
+    """
+    sources, morphologies, failures = [], [], []
+    for path in paths:
+        try:
+            morphologies.append(yaml_io.read_morphology(path))
+            sources.append(path)
+        except (MorphologyError, yaml.YAMLError, OSError) as error:
+            failures.append((path, f"{type(error).__name__}: {error}"))
+    if not morphologies:
+        return [], failures
+    records = describe(Population(morphologies)).tolist()
+    names = [m.name for m in morphologies]
+    return [(s, n) + r for s, n, r in zip(sources, names, records)], failures
+
+
+def describe_archive(path: str, chunk: int = ARCHIVE_CHUNK):
+    """
+    Args:
+        path: Archive of robots
+        chunk: Number of robots described at once
+
+    Yields: rows of the CSV, straight from the node arrays of the archive
+    """
+    with Archive(path) as archive:
+        for start in range(0, len(archive), chunk):
+            indices = range(start, min(start + chunk, len(archive)))
+            nodes = [archive.nodes(i) for i in indices]
+            sizes = [len(n) for n in nodes]
+            stacked = np.concatenate(nodes)
+            del nodes  # Views on the file, they must not outlive the archive
+            population = Population.from_arrays(
+                sizes,
+                stacked["parent"],
+                stacked["slot"],
+                stacked["type"],
+                stacked["orientation"],
+            )
+            records = describe(population).tolist()
+            for i, record in zip(indices, records):
+                yield (f"{path}:{i}", archive.name(i)) + record
+
+
+def is_archive(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def main(args) -> int:
+    """Entry point of `python -m devolve describe`"""
+    start = time.perf_counter()
+    failures = []
+    stream = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(stream)
+        writer.writerow(("source", "id") + DESCRIPTOR.names)
+        robots = 0
+        if is_archive(args.target):
+            for row in describe_archive(args.target):
+                writer.writerow(row)
+                robots += 1
+        else:
+            paths = iter(iter_paths(args.target))
+            chunks = iter(lambda: list(itertools.islice(paths, args.chunksize)), [])
+            with multiprocessing.Pool(args.jobs) as pool:
+                for rows, failed in pool.imap(describe_files, chunks):
+                    writer.writerows(rows)
+                    robots += len(rows)
+                    failures.extend(failed)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    for path, error in failures:
+        sys.stderr.write(f"FAILED {path}: {error}\n")
+    seconds = max(time.perf_counter() - start, 1e-9)
+    sys.stderr.write(
+        f"{robots} robots ({len(failures)} failed) described in {seconds:.2f} s: "
+        f"{robots / seconds:.0f} robots/s\n"
+    )
+    return 1 if failures else 0
+
+
+def add_parser(subparsers) -> None:
+    parser = subparsers.add_parser(
+        "describe", help="write morphological descriptors of robots as CSV"
+    )
+    parser.add_argument(
+        "target", help="archive, directory or glob pattern of YAML files"
+    )
+    parser.add_argument("-o", "--output", help="CSV file to write (stdout)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (all cores)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.set_defaults(func=main)
@@ -0,0 +1,80 @@
+""" Tree diff of two robots
+
+Finds the few edits that turn a robot into another one, so reloading a robot that differs
+from the one in the editor by a few parts only touches those parts. The trees are walked
+together from the core, slot by slot: parts on the same slot with the same orientation
+are the same part (their cells and the cells of their children are the same), which at
+most needs a new type or color; any other difference replaces the whole subtree.
+
+Example:
+    >>> changes = diff(robot, read_morphology("offspring.yaml"))
+    >>> len(changes.removed), len(changes.restyled), len(changes.added)
+    (1, 0, 1)
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+from typing import NamedTuple
+
+# Local
+from devolve.constants import SLOTS
+from devolve.morphology import NONE, ROOT, Morphology
+
+
+# =============================== Diff ===================================== #
+class Diff(NamedTuple):
+    """Edits turning a robot into another one
+
+    Attributes:
+        removed: Rows of the robot whose subtree goes
+        restyled: (row of the robot, row of the other robot) pairs of parts that stay in
+            place but change type or color
+        added: (row of the robot, row of the other robot) pairs, the subtree of the other
+            robot to attach to the part of the robot
+    """
+
+    removed: list
+    restyled: list
+    added: list
+
+
+def same_style(morphology: Morphology, row: int, other: Morphology, other_row: int):
+    """Returns: whether the two parts have the same type and color"""
+    return morphology.part_type[row] == other.part_type[other_row] and tuple(
+        morphology.rgb(row)
+    ) == tuple(other.rgb(other_row))
+
+
+def diff(morphology: Morphology, other: Morphology) -> Diff:
+    """
+    Args:
+        morphology: Robot to edit
+        other: Robot to turn it into
+
+    Returns: the edits, removing then restyling then adding
+    """
+    removed, restyled, added = [], [], []
+    if not same_style(morphology, ROOT, other, ROOT):
+        restyled.append((ROOT, ROOT))
+    stack = [(ROOT, ROOT)]
+    while stack:
+        row, other_row = stack.pop()
+        for slot in range(SLOTS):
+            child = int(morphology.children[row, slot])
+            other_child = int(other.children[other_row, slot])
+            if child == NONE and other_child == NONE:
+                continue
+            if (
+                child != NONE
+                and other_child != NONE
+                and morphology.orientation[child] == other.orientation[other_child]
+            ):
+                if not same_style(morphology, child, other, other_child):
+                    restyled.append((child, other_child))
+                stack.append((child, other_child))
+                continue
+            if child != NONE:
+                removed.append(child)
+            if other_child != NONE:
+                added.append((row, other_child))
+    return Diff(removed, restyled, added)
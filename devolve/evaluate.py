@@ -0,0 +1,204 @@
+""" Batched physics evaluation of robots with MuJoCo
+
+Scores a directory of robot files by how far their core travels on a flat floor in a fixed
+time, driven by an open-loop controller: every hinge follows a sine wave of the same
+frequency, phase shifted along the actuators (pre-order of the hinges).
+
+The files are parsed and hashed by a pool of processes, robots with the same model hash
+(devolve.mjcf: same parts, actuator order and hinge axes, so the controller drives them
+the same way) are simulated once and the models are compiled through the ModelCache of
+devolve.mjcf. Robots that are only symmetric to each other are simulated apart, their
+actuators come in another order so they get other phases. Models with the same signature are simulated together by one
+mujoco.rollout call, the calls run on a pool of threads (rollout releases the GIL), so
+all the cores are busy even when every body is different. Rollouts run in chunks of
+steps, only the last state of every chunk is kept.
+
+Example:
+    $ python -m devolve evaluate data_fullevolution/phenotypes -o fitness.csv
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import collections
+import concurrent.futures
+import csv
+import functools
+import multiprocessing
+import os
+import sys
+import time
+
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve import yaml_io
+from devolve.batch import CHUNKSIZE, iter_paths
+from devolve.canonical import hash_file
+from devolve.mjcf import HINGE_RANGE, ModelCache, model_hash, mujoco
+
+try:
+    from mujoco import rollout
+except ImportError:
+    rollout = None
+
+# =============================== Constants ===================================== #
+DURATION = 10.0
+"""float: module level constant
+Simulated seconds per robot
+"""
+
+FREQUENCY = 1.0
+"""float: module level constant
+Frequency of the hinge sine waves in Hz
+"""
+
+STEP_CHUNK = 100
+"""int: module level constant
+Steps simulated per rollout call, the states of the steps in between are dropped
+"""
+
+BATCH = 256
+"""int: module level constant
+Most robots simulated by one rollout call
+"""
+
+
+# =============================== Simulation ===================================== #
+def controls(nu: int, times) -> np.array:
+    """
+    Args:
+        nu: Number of actuators
+        times: Simulation times
+
+    Returns: (len(times), nu) target angles of the hinges
+    """
+    phase = 2 * np.pi * np.arange(nu) / max(nu, 1)
+    wave = 2 * np.pi * FREQUENCY * np.asarray(times)[:, None]
+    return HINGE_RANGE * np.sin(wave + phase)
+
+
+def initial_state(model) -> np.array:
+    """Returns: full physics state of the model at rest, as the rollout takes it"""
+    data = mujoco.MjData(model)
+    spec = mujoco.mjtState.mjSTATE_FULLPHYSICS
+    state = np.zeros(mujoco.mj_stateSize(model, spec))
+    mujoco.mj_getState(model, data, state, spec)
+    return state
+
+
+def simulate(models, duration: float = DURATION) -> np.array:
+    """
+    Args:
+        models: MjModels with the same signature
+        duration: Simulated seconds
+
+    Returns: (len(models),) distance travelled by the core in the xy plane
+    """
+    first = models[0]
+    data = mujoco.MjData(first)
+    state = np.stack([initial_state(model) for model in models])
+    start = state[:, 1:3].copy()  # Time first, then the position of the free joint
+    nstep = int(round(duration / first.opt.timestep))
+    for step in range(0, nstep, STEP_CHUNK):
+        steps = min(STEP_CHUNK, nstep - step)
+        control = None
+        if first.nu:
+            times = (step + np.arange(steps)) * first.opt.timestep
+            control = controls(first.nu, times)[None]
+        states, _ = rollout.rollout(models, data, state, control, nstep=steps)
+        state = states[:, -1]
+    return np.linalg.norm(state[:, 1:3] - start, axis=1)
+
+
+def evaluate(models: dict, nthread=None, duration: float = DURATION) -> dict:
+    """
+    Args:
+        models: Model hash -> MjModel of the robots to evaluate
+        nthread: Number of simulation threads, defaults to the number of cores
+        duration: Simulated seconds
+
+    Returns: model hash -> distance travelled by the core
+    """
+    groups = collections.defaultdict(list)
+    for digest, model in models.items():
+        # Models loaded from .mjb files have no signature, they are simulated alone
+        groups[model.signature or digest].append(digest)
+    batches = [
+        digests[start : start + BATCH]
+        for digests in groups.values()
+        for start in range(0, len(digests), BATCH)
+    ]
+
+    fitness = {}
+    with concurrent.futures.ThreadPoolExecutor(nthread or os.cpu_count()) as pool:
+        results = pool.map(
+            lambda batch: simulate([models[d] for d in batch], duration), batches
+        )
+        for batch, distance in zip(batches, results):
+            fitness.update(zip(batch, distance.tolist()))
+    return fitness
+
+
+# =============================== Command line ===================================== #
+def main(args) -> int:
+    """Entry point of `python -m devolve evaluate`"""
+    if rollout is None:
+        sys.stderr.write("devolve evaluate needs the mujoco package\n")
+        return 1
+    start = time.perf_counter()
+    hashes, failures = [], []
+    with multiprocessing.Pool(args.jobs) as pool:
+        for path, digest, error in pool.imap(
+            functools.partial(hash_file, hasher=model_hash),
+            iter_paths(args.target),
+            args.chunksize,
+        ):
+            if error is not None:
+                failures.append((path, error))
+            else:
+                hashes.append((path, digest))
+
+    cache = ModelCache(args.cache)
+    models = {}
+    for path, digest in hashes:
+        if digest not in models:
+            models[digest] = cache.model(yaml_io.read_morphology(path), digest)
+    loaded = time.perf_counter()
+
+    fitness = evaluate(models, args.threads, args.duration)
+    simulated = time.perf_counter()
+
+    stream = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(stream)
+        writer.writerow(("source", "hash", "displacement"))
+        writer.writerows((path, d, fitness[d]) for path, d in hashes)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    for path, error in failures:
+        sys.stderr.write(f"FAILED {path}: {error}\n")
+    steps = sum(int(round(args.duration / m.opt.timestep)) for m in models.values())
+    seconds = max(simulated - loaded, 1e-9)
+    sys.stderr.write(
+        f"{len(hashes)} robots ({len(failures)} failed), {len(models)} distinct models "
+        f"({cache.misses} compiled), loaded in {loaded - start:.2f} s, "
+        f"simulated in {seconds:.2f} s: {steps / seconds:.0f} steps/s\n"
+    )
+    return 1 if failures else 0
+
+
+def add_parser(subparsers) -> None:
+    parser = subparsers.add_parser(
+        "evaluate", help="simulate robots with MuJoCo and write their displacement"
+    )
+    parser.add_argument("target", help="directory or glob pattern of YAML files")
+    parser.add_argument("-o", "--output", help="CSV file to write (stdout)")
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds")
+    parser.add_argument("--threads", type=int, help="simulation threads (all cores)")
+    parser.add_argument("--cache", help="folder keeping the compiled models")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (all cores)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.set_defaults(func=main)
@@ -0,0 +1,301 @@
+""" Populations of robot genomes as flat arrays
+
+The evolutionary operators (devolve.mutation, devolve.crossover) work on many robots at once,
+so they do not use one Morphology (or nested dict) per robot: Genomes stacks the nodes of
+all the robots in the archive layout, one entry per part with the index of its parent
+within its robot, its slot, type, orientation and color. Every robot starts with its core
+and lists parents before their children, colors index one palette shared by the batch.
+
+Selecting, copying and concatenating robots are a few fancy-indexing operations on these
+arrays, the geometry comes from the batched kinematics when it is needed.
+
+Example:
+    >>> with Archive("population.dva") as archive:
+    ...     genomes = Genomes.from_archive(archive)
+    >>> parents = genomes.take(rng.integers(len(genomes), size=100_000))
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.archive import Archive, ArchiveWriter
+from devolve.constants import ORIENTATIONS, PART_COLORS, PART_TYPES, SLOTS
+from devolve.kinematics import Population
+from devolve.morphology import NONE, ROOT, Morphology
+
+
+# =============================== Functions ===================================== #
+def ranges(starts, sizes) -> np.array:
+    """
+    Args:
+        starts: First index of every range
+        sizes: Length of every range
+
+    Returns: the indices of all the ranges, concatenated
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    ends = np.cumsum(sizes)
+    return np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+        starts - ends + sizes, sizes
+    )
+
+
+def _offsets(sizes) -> np.array:
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return offsets
+
+
+# =============================== Genomes ===================================== #
+class Genomes:
+    """Robots stacked into flat node arrays
+
+    Attributes:
+        offsets: First node of every robot, plus the total number of nodes
+        parent: Index of the parent of every node within its robot, NONE for the cores
+        slot: Slot of the parent every node is attached to
+        part_type: Index into PART_TYPES of every node
+        orientation: Orientation of every node in degrees
+        color: Index into palette of every node
+        palette: List of (red, green, blue) tuples shared by all the robots
+        names: Id of every robot
+    """
+
+    def __init__(
+        self, offsets, parent, slot, part_type, orientation, color, palette, names
+    ) -> None:
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.slot = np.asarray(slot, dtype=np.uint8)
+        self.part_type = np.asarray(part_type, dtype=np.uint8)
+        self.orientation = np.asarray(orientation, dtype=np.uint8)
+        self.color = np.asarray(color, dtype=np.uint16)
+        self.palette = palette
+        self.names = list(names)
+
+    @classmethod
+    def from_morphologies(cls, morphologies) -> "Genomes":
+        index = {}
+        columns = [[], [], [], [], []]
+        sizes = []
+        for m in morphologies:
+            order = np.array(m.subtree(ROOT))
+            local = np.full(m.size, NONE, dtype=np.int64)
+            local[order] = np.arange(len(order))
+            remap = np.array([index.setdefault(rgb, len(index)) for rgb in m.palette])
+            parent = m.parent[order]
+            columns[0].append(np.where(parent == NONE, NONE, local[parent]))
+            columns[1].append(m.slot[order])
+            columns[2].append(m.part_type[order])
+            columns[3].append(m.orientation[order])
+            columns[4].append(remap[m.color[order]])
+            sizes.append(len(order))
+        palette = list(index)
+        names = [m.name for m in morphologies]
+        if not sizes:
+            return cls(np.zeros(1), [], [], [], [], [], palette, names)
+        return cls(_offsets(sizes), *map(np.concatenate, columns), palette, names)
+
+    @classmethod
+    def from_archive(cls, archive: Archive, indices=None) -> "Genomes":
+        """
+        Args:
+            archive: Open archive
+            indices: Robots to read, all of them by default
+
+        Returns: the robots, copied out of the archive
+        """
+        indices = range(len(archive)) if indices is None else indices
+        index = {}
+        sizes, nodes, colors = [], [], []
+        for i in indices:
+            _, _, records, robot = archive.record(i)
+            rgb = [
+                tuple(
+                    int(v) if record["ints"] >> c & 1 else float(v)
+                    for c, v in enumerate(record["rgb"])
+                )
+                for record in records
+            ]
+            remap = np.array([index.setdefault(c, len(index)) for c in rgb])
+            colors.append(remap[robot["color"]])
+            nodes.append(robot.copy())
+            sizes.append(len(robot))
+        palette = list(index)
+        names = [archive.name(i) for i in indices]
+        if not sizes:
+            return cls(np.zeros(1), [], [], [], [], [], palette, names)
+        nodes = np.concatenate(nodes)
+        return cls(
+            _offsets(sizes),
+            nodes["parent"],
+            nodes["slot"],
+            nodes["type"],
+            nodes["orientation"],
+            np.concatenate(colors),
+            palette,
+            names,
+        )
+
+    # ======== QUERIES ======== #
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def sizes(self) -> np.array:
+        """Number of parts of every robot"""
+        return np.diff(self.offsets)
+
+    @property
+    def owner(self) -> np.array:
+        """Robot of every node"""
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    def global_parent(self) -> np.array:
+        """Returns: index of the parent of every node in the stacked arrays, or NONE"""
+        parent = self.parent.astype(np.int64)
+        return np.where(parent == NONE, NONE, parent + self.offsets[self.owner])
+
+    def children(self) -> np.array:
+        """Returns: (nodes, SLOTS) stacked index of the children of every node or NONE"""
+        children = np.full((len(self.parent), SLOTS), NONE, dtype=np.int64)
+        parent = self.global_parent()
+        child = np.flatnonzero(parent != NONE)
+        children[parent[child], self.slot[child]] = child
+        return children
+
+    def subtree_mask(self, roots) -> np.array:
+        """
+        Args:
+            roots: Stacked indices of the roots of some subtrees
+
+        Returns: (nodes,) bool, whether the node is in one of the subtrees
+        """
+        mask = np.zeros(len(self.parent), dtype=bool)
+        children = self.children()
+        frontier = np.asarray(roots, dtype=np.int64)
+        while len(frontier):
+            mask[frontier] = True
+            frontier = children[frontier]
+            frontier = frontier[frontier != NONE]
+        return mask
+
+    def population(self) -> Population:
+        """Returns: the robots as a kinematics Population, nodes keep their index"""
+        return Population.from_arrays(
+            self.sizes, self.parent, self.slot, self.part_type, self.orientation
+        )
+
+    def color_index(self, rgb) -> int:
+        """Returns: index of the color in the palette, adding it if needed"""
+        rgb = tuple(rgb)
+        if rgb not in self.palette:
+            self.palette.append(rgb)
+        return self.palette.index(rgb)
+
+    def default_colors(self) -> np.array:
+        """Returns: (len(ORIENTATIONS), len(PART_TYPES)) palette index of PART_COLORS"""
+        return np.array(
+            [
+                [
+                    self.color_index(PART_COLORS[o].get(t, PART_COLORS[0][t]))
+                    for t in PART_TYPES
+                ]
+                for o in ORIENTATIONS
+            ],
+            dtype=np.uint16,
+        )
+
+    # ======== ROBOTS ======== #
+    def to_morphology(self, i: int) -> Morphology:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return Morphology.from_arrays(
+            self.names[i],
+            self.parent[start:end],
+            self.slot[start:end],
+            self.part_type[start:end],
+            self.orientation[start:end],
+            self.color[start:end],
+            self.palette,
+        )
+
+    def write(self, path: str) -> None:
+        """Writes the robots to an archive file"""
+        with ArchiveWriter(path) as archive:
+            for i in range(len(self)):
+                archive.add(self.to_morphology(i))
+
+    def take(self, robots) -> "Genomes":
+        """
+        Args:
+            robots: Indices of the robots to copy, in order, repetitions allowed
+
+        Returns: the copies, sharing this palette
+        """
+        robots = np.asarray(robots, dtype=np.int64)
+        sizes = self.sizes[robots]
+        nodes = ranges(self.offsets[robots], sizes)
+        return Genomes(
+            _offsets(sizes),
+            self.parent[nodes],
+            self.slot[nodes],
+            self.part_type[nodes],
+            self.orientation[nodes],
+            self.color[nodes],
+            self.palette,
+            [self.names[r] for r in robots.tolist()],
+        )
+
+    def keep(self, mask) -> "Genomes":
+        """
+        Args:
+            mask: Nodes to keep, the parent of every kept node must be kept too
+
+        Returns: the robots without the other nodes
+        """
+        mask = np.asarray(mask, dtype=bool)
+        new_index = np.cumsum(mask) - 1
+        owner = self.owner
+        sizes = np.bincount(owner[mask], minlength=len(self))
+        offsets = _offsets(sizes)
+        parent = self.global_parent()[mask]
+        local = np.where(parent == NONE, NONE, new_index[parent] - offsets[owner[mask]])
+        return Genomes(
+            offsets,
+            local,
+            self.slot[mask],
+            self.part_type[mask],
+            self.orientation[mask],
+            self.color[mask],
+            self.palette,
+            self.names,
+        )
+
+    @classmethod
+    def concatenate(cls, batches) -> "Genomes":
+        """
+        Args:
+            batches: Genomes sharing one palette
+
+        Returns: all their robots, in order
+        """
+        palette = batches[0].palette
+        if any(b.palette is not palette for b in batches):
+            raise ValueError("Only Genomes sharing a palette can be concatenated")
+        return cls(
+            _offsets(np.concatenate([b.sizes for b in batches])),
+            np.concatenate([b.parent for b in batches]),
+            np.concatenate([b.slot for b in batches]),
+            np.concatenate([b.part_type for b in batches]),
+            np.concatenate([b.orientation for b in batches]),
+            np.concatenate([b.color for b in batches]),
+            palette,
+            [name for b in batches for name in b.names],
+        )
+
+    def overlapping(self) -> np.array:
+        """Returns: (len(self),) bool, whether two parts of the robot share a cell"""
+        return self.population().overlapping()
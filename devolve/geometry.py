@@ -0,0 +1,209 @@
+""" Lattice geometry of attached parts
+
+Every part sits on an integer lattice cell relative to the core, with a frame that is one
+of the 24 rotations of the cube (columns of the matrix = where the local x, y, z axes of
+the part point). The local +y axis of a part points away from its parent. Frames are
+stored as indices into ROTATIONS, so composing two of them is a table lookup.
+
+ATTACHMENTS gathers all the rules in one table, used both by the editor (to place the
+Voxels) and by the headless tools. The conventions match the Ursina transforms:
+    - a child at a given offset is rolled by SLOT_ROLL degrees (Ursina rotation_z),
+    - orientation 90 turns it a quarter turn about its own +y axis.
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import itertools
+from typing import NamedTuple
+
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.constants import CORE, ORIENTATIONS, PART_TYPES, SLOTS
+
+# =============================== Constants ===================================== #
+CORE_SLOT_OFFSETS = ((-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0))
+PART_SLOT_OFFSETS = ((0, -1, 0), (0, 1, 0), (1, 0, 0), (-1, 0, 0))
+"""tuple: module level constants
+Offset of the cell of the child attached to every slot, in the frame of the parent
+"""
+
+SLOT_ROLL = {(-1, 0, 0): -90, (1, 0, 0): 90, (0, -1, 0): -180, (0, 1, 0): 0}
+"""dict: module level constant
+Ursina rotation_z of a child attached at a given offset
+"""
+
+SLOT_EULER = {
+    (-1, 0, 0): (90, 0),
+    (1, 0, 0): (-90, 0),
+    (0, -1, 0): (0, 90),
+    (0, 1, 0): (0, -90),
+}
+"""dict: module level constant
+Ursina (rotation_x, rotation_y) of a child with orientation 90 attached at a given offset
+"""
+
+
+def rot_z(degrees: int) -> np.array:
+    """Integer rotation matrix of a Ursina rotation_z (clockwise seen from -z)"""
+    radians = np.radians(degrees)
+    c, s = int(round(np.cos(radians))), int(round(np.sin(radians)))
+    return np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]], dtype=np.int8)
+
+
+def rot_y(degrees: int) -> np.array:
+    """Integer rotation matrix of a Ursina rotation_y"""
+    radians = np.radians(degrees)
+    c, s = int(round(np.cos(radians))), int(round(np.sin(radians)))
+    return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]], dtype=np.int8)
+
+
+ORIENTATION_TURN = {0: np.eye(3, dtype=np.int8), 90: rot_y(-90)}
+"""dict: module level constant
+Turn about the local +y axis applied by the orientation of a part
+"""
+
+
+# =============================== Rotation group ===================================== #
+def _rotation_group() -> np.array:
+    """The 24 signed permutation matrices with determinant +1, identity first"""
+    group = []
+    for perm in itertools.permutations(range(3)):
+        for signs in itertools.product((1, -1), repeat=3):
+            matrix = np.zeros((3, 3), dtype=np.int8)
+            matrix[range(3), perm] = signs
+            if round(np.linalg.det(matrix)) == 1:
+                group.append(matrix)
+    return np.stack(group)
+
+
+ROTATIONS = _rotation_group()
+"""np.array: module level constant
+(24, 3, 3) int8 rotation matrices of the cube, ROTATIONS[IDENTITY] is the identity
+"""
+
+IDENTITY = 0
+
+_ROTATION_INDEX = {m.tobytes(): i for i, m in enumerate(ROTATIONS)}
+
+
+def rotation_index(matrix) -> int:
+    """Index in ROTATIONS of an integer rotation matrix"""
+    return _ROTATION_INDEX[np.asarray(matrix, dtype=np.int8).tobytes()]
+
+
+COMPOSE = np.array(
+    [[rotation_index(a.astype(int) @ b) for b in ROTATIONS] for a in ROTATIONS],
+    dtype=np.uint8,
+)
+"""np.array: module level constant
+(24, 24) table, ROTATIONS[COMPOSE[a, b]] == ROTATIONS[a] @ ROTATIONS[b]
+"""
+
+
+# =============================== Attachments ===================================== #
+class Attachment(NamedTuple):
+    """Where and how a child sits relative to its parent
+
+    Attributes:
+        offset: Cell of the child in the frame of the parent
+        euler: Ursina (rotation_x, rotation_y, rotation_z) of the child
+        turn: Frame of the child relative to its parent, index in ROTATIONS
+    """
+
+    offset: tuple
+    euler: tuple
+    turn: int
+
+
+def _attachment(core: bool, slot: int, orientation: int) -> Attachment:
+    offset = CORE_SLOT_OFFSETS[slot] if core else PART_SLOT_OFFSETS[slot]
+    roll = SLOT_ROLL[offset]
+    rotation_x, rotation_y = SLOT_EULER[offset] if orientation == 90 else (0, 0)
+    turn = rot_z(roll).astype(int) @ ORIENTATION_TURN[orientation]
+    return Attachment(offset, (rotation_x, rotation_y, roll), rotation_index(turn))
+
+
+ATTACHMENTS = {
+    (_type, slot, orientation): _attachment(_type == CORE, slot, orientation)
+    for _type in PART_TYPES
+    for slot in range(SLOTS)
+    for orientation in ORIENTATIONS
+}
+"""dict: module level constant
+Attachment of a child, indexed by (parent type, slot, child orientation)
+"""
+
+NORMAL_SLOTS = {
+    (core, _attachment(core, slot, 0).offset): slot
+    for core in (False, True)
+    for slot in range(SLOTS)
+}
+"""dict: module level constant
+Slot facing a given (face normal) direction, indexed by (parent is core, direction)
+"""
+
+SLOT_OFFSETS = np.array([PART_SLOT_OFFSETS, CORE_SLOT_OFFSETS], dtype=np.int32)
+"""np.array: module level constant
+(2, SLOTS, 3) offsets of the child cells, indexed by [is core, slot]
+"""
+
+CHILD_TURN = np.array(
+    [
+        [
+            [_attachment(core, slot, orientation).turn for orientation in ORIENTATIONS]
+            for slot in range(SLOTS)
+        ]
+        for core in (False, True)
+    ],
+    dtype=np.uint8,
+)
+"""np.array: module level constant
+(2, SLOTS, len(ORIENTATIONS)) ATTACHMENTS turns as an array, indexed by
+[is core, slot, orientation index]
+"""
+
+ROTATED_OFFSETS = np.einsum("rij,csj->rcsi", ROTATIONS.astype(np.int32), SLOT_OFFSETS)
+"""np.array: module level constant
+(24, 2, SLOTS, 3) child cell offsets of a parent with a given frame, indexed by
+[parent rotation, is core, slot]
+"""
+
+
+# =============================== Functions ===================================== #
+def orientation_index(orientation):
+    """Index (or array of indices) in ORIENTATIONS of orientations given in degrees"""
+    return np.searchsorted(ORIENTATIONS, orientation)
+
+
+def normal_slot(normal, core: bool):
+    """
+    Args:
+        normal: Direction of a face of the part (e.g. Ursina mouse.normal)
+        core: Whether the part is the core component
+
+    Returns: the slot on that face, None if there is none
+    """
+    if normal is None:
+        return None
+    return NORMAL_SLOTS.get((core, tuple(int(round(c)) for c in normal)))
+
+
+def attach(position, rotation: int, core: bool, slot: int, orientation: int) -> tuple:
+    """
+    Args:
+        position: Cell of the parent
+        rotation: Frame of the parent, index in ROTATIONS
+        core: Whether the parent is the core component
+        slot: Slot of the parent the child is attached to
+        orientation: Orientation of the child in degrees
+
+    Returns: (cell, rotation index) of the child
+    """
+    cell = (
+        np.asarray(position, dtype=np.int32)
+        + ROTATED_OFFSETS[rotation, int(core), slot]
+    )
+    turn = CHILD_TURN[int(core), slot, orientation_index(orientation)]
+    return cell, int(COMPOSE[rotation, turn])
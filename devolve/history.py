@@ -0,0 +1,224 @@
+""" Undo/redo of Morphology edits
+
+Every add, remove, load and clear is recorded as one compact Edit (the rows it touched and
+their part types) in a bounded history. Undoing and redoing only flip those rows between
+removed and present with Morphology.remove_subtree/restore_subtree, nothing is rebuilt, so
+undoing the clear of a large robot costs about as much as the clear itself. A reload is
+one step made of a removal, a Restyle (old and new types and colors of the parts that
+stay) and an addition, undone and redone at once.
+
+Rows that can never come back (removed by an edit that fell off the history, or added by
+an edit that was undone and then overwritten) are released to the Morphology for reuse
+and handed to the on_drop callback.
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import collections
+from typing import NamedTuple
+
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.diff import diff
+from devolve.morphology import NONE, ROOT, Morphology
+
+# =============================== Constants ===================================== #
+HISTORY_SIZE = 256
+"""int: module level constant
+Number of edits that can be undone
+"""
+
+
+# =============================== History ===================================== #
+class Edit(NamedTuple):
+    """One recorded edit
+
+    Attributes:
+        added: True if the edit added the subtrees, False if it removed them
+        roots: Roots of the subtrees, in the order they were edited
+        rows: Rows of the subtrees, in pre-order
+        types: Part types of the rows of every subtree, one array per root
+    """
+
+    added: bool
+    roots: tuple
+    rows: np.array
+    types: tuple
+
+
+class Restyle(NamedTuple):
+    """Types and colors changed by an edit, the parts stay in place
+
+    Attributes:
+        rows: Restyled rows
+        types: (2, len(rows)) part types of the rows before and after the edit
+        colors: (2, len(rows)) palette index of their colors before and after the edit
+    """
+
+    rows: np.array
+    types: np.array
+    colors: np.array
+
+
+class History:
+    """Records the edits of a Morphology so they can be undone and redone
+
+    Attributes:
+        morphology: Robot being edited, edits should go through the History
+        size: Number of edits kept
+        on_drop: Called with an Edit whose rows will never be present again, after they
+            were released
+        done: Steps that can be undone, oldest first, every step is a tuple of Edits
+            and Restyles done in that order
+        undone: Steps that can be redone, most recently undone last
+    """
+
+    def __init__(self, morphology: Morphology, size: int = HISTORY_SIZE, on_drop=None):
+        self.morphology = morphology
+        self.size = size
+        self.on_drop = on_drop
+        self.done = collections.deque()
+        self.undone = []
+
+    def _edit(self, added: bool, roots) -> Edit:
+        subtrees = [self.morphology.subtree(root) for root in roots]
+        rows = np.array(
+            [row for subtree in subtrees for row in subtree], dtype=np.int32
+        )
+        types = tuple(self.morphology.part_type[subtree].copy() for subtree in subtrees)
+        return Edit(added, tuple(roots), rows, types)
+
+    def _drop(self, edit: Edit) -> None:
+        self.morphology.release(edit.rows.tolist())
+        if self.on_drop is not None:
+            self.on_drop(edit)
+
+    def _push(self, *changes) -> None:
+        step = tuple(change for change in changes if len(change.rows))
+        if not step:
+            return
+        for undone in self.undone:
+            for change in undone:
+                if isinstance(change, Edit) and change.added:
+                    self._drop(change)
+        self.undone.clear()
+        self.done.append(step)
+        if len(self.done) > self.size:
+            for change in self.done.popleft():
+                if isinstance(change, Edit) and not change.added:
+                    self._drop(change)
+
+    def _apply(self, step: tuple, forward: bool) -> list:
+        changes = []
+        for change in step if forward else reversed(step):
+            if isinstance(change, Restyle):
+                after = int(forward)
+                for row, part_type, color in zip(
+                    change.rows.tolist(),
+                    change.types[after].tolist(),
+                    change.colors[after].tolist(),
+                ):
+                    self.morphology.restyle(row, part_type, color)
+                changes.append((change, forward))
+                continue
+            present = change.added == forward
+            if present:
+                for root, types in zip(change.roots, change.types):
+                    self.morphology.restore_subtree(root, types)
+            else:
+                for root in reversed(change.roots):
+                    self.morphology.remove_subtree(root)
+            changes.append((change, present))
+        return changes
+
+    # ======== EDITING ======== #
+    def add_part(
+        self, parent: int, slot: int, _type: str, orientation: int = 0, rgb=None
+    ) -> Edit:
+        """Morphology.add_part, recorded. Returns: the Edit, its root is the new row"""
+        row = self.morphology.add_part(parent, slot, _type, orientation, rgb)
+        edit = self._edit(True, [row])
+        self._push(edit)
+        return edit
+
+    def remove_subtree(self, row: int) -> Edit:
+        """Morphology.remove_subtree, recorded. Returns: the Edit"""
+        edit = self._edit(False, [row])
+        self.morphology.remove_subtree(row)
+        self._push(edit)
+        return edit
+
+    def merge(self, other: Morphology) -> Edit:
+        """Morphology.merge, recorded. Returns: the Edit, its roots are the grafted rows"""
+        edit = self._edit(True, self.morphology.merge(other))
+        self._push(edit)
+        return edit
+
+    def clear(self) -> Edit:
+        """Morphology.clear, recorded. Returns: the Edit"""
+        edit = self._edit(False, [c for _, c in self.morphology.child_items(ROOT)])
+        self.morphology.clear()
+        self._push(edit)
+        return edit
+
+    def reload(self, other: Morphology) -> tuple:
+        """
+        Turns the robot into a copy of another one, only editing the parts that differ
+        (see devolve.diff), recorded as a single step
+
+        Args:
+            other: Robot to copy
+
+        Returns: (removal Edit, Restyle, addition Edit), the roots of the addition are
+        the grafted rows
+        """
+        m = self.morphology
+        changes = diff(m, other)
+        removal = self._edit(False, changes.removed)
+        for row in changes.removed:
+            m.remove_subtree(row)
+
+        rows = np.array([row for row, _ in changes.restyled], dtype=np.int32)
+        new_types = [other.part_type[row] for _, row in changes.restyled]
+        new_colors = [m.color_index(other.rgb(row)) for _, row in changes.restyled]
+        restyle = Restyle(
+            rows,
+            np.array([m.part_type[rows], new_types], dtype=m.part_type.dtype),
+            np.array([m.color[rows], new_colors], dtype=m.color.dtype),
+        )
+        for row, part_type, color in zip(rows.tolist(), new_types, new_colors):
+            m.restyle(row, part_type, color)
+
+        roots = [m.graft(other, row, parent) for parent, row in changes.added]
+        addition = self._edit(True, [root for root in roots if root != NONE])
+        self._push(removal, restyle, addition)
+        return removal, restyle, addition
+
+    # ======== UNDO/REDO ======== #
+    def undo(self) -> list:
+        """
+        Returns: (Edit, whether its rows are now present) or (Restyle, whether the rows
+        have their new style) pairs of the changes undone, in the order they were undone,
+        empty if there is nothing to undo
+        """
+        if not self.done:
+            return []
+        step = self.done.pop()
+        changes = self._apply(step, False)
+        self.undone.append(step)
+        return changes
+
+    def redo(self) -> list:
+        """
+        Returns: (Edit, whether its rows are now present) or (Restyle, whether the rows
+        have their new style) pairs of the changes redone, in the order they were redone,
+        empty if there is nothing to redo
+        """
+        if not self.undone:
+            return []
+        step = self.undone.pop()
+        changes = self._apply(step, True)
+        self.done.append(step)
+        return changes
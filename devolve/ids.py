@@ -0,0 +1,43 @@
+""" Part id allocation
+
+Every Morphology owns its allocators (one per part type for the serial numbers in the
+part ids, one for its rows), so robots built or loaded side by side, or processed by
+parallel workers, never share counters.
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import heapq
+
+
+# =============================== Allocator ===================================== #
+class IdAllocator:
+    """Hands out the smallest free number, reusing released ones first
+
+    Attributes:
+        next: Smallest number never handed out
+        free: Heap of released numbers below next
+    """
+
+    def __init__(self, start: int = 1) -> None:
+        self.start = start
+        self.next = start
+        self.free = []
+
+    def __len__(self) -> int:
+        """Number of numbers in use"""
+        return self.next - self.start - len(self.free)
+
+    def allocate(self) -> int:
+        if self.free:
+            return heapq.heappop(self.free)
+        self.next += 1
+        return self.next - 1
+
+    def release(self, number: int) -> None:
+        heapq.heappush(self.free, int(number))
+
+    def reset(self, used: int = 0) -> None:
+        """Marks the first `used` numbers as taken and everything else as free"""
+        self.next = self.start + used
+        self.free = []
@@ -0,0 +1,155 @@
+""" Batched forward kinematics
+
+Places every part of many robots at once: the bodies are stacked into flat arrays and
+walked breadth first, one NumPy pass per tree level, with the cube rotation group tables
+of devolve.geometry doing all the geometry (no matrices are multiplied per part).
+
+Example:
+    >>> population = Population([Morphology.from_dict(d) for d in robots])
+    >>> position, rotation = population.forward()
+    >>> population.overlapping(position)
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.constants import SLOTS
+from devolve.geometry import (
+    CHILD_TURN,
+    COMPOSE,
+    IDENTITY,
+    ROTATED_OFFSETS,
+    orientation_index,
+)
+from devolve.morphology import EMPTY, NONE, ROOT
+from devolve.occupancy import pack_array
+
+
+# =============================== Functions ===================================== #
+def forward(children, orientation, roots) -> tuple:
+    """
+    Args:
+        children: (n, SLOTS) rows of the children of every part, NONE for free slots
+        orientation: (n,) orientation of every part in degrees
+        roots: Rows of the core components
+
+    Returns: ((n, 3) int32 lattice cells, (n,) uint8 indices in geometry.ROTATIONS),
+    rows that can not be reached from a root are left at the origin
+    """
+    children = np.asarray(children)
+    turn = orientation_index(np.asarray(orientation))
+    position = np.zeros((len(children), 3), dtype=np.int32)
+    rotation = np.full(len(children), IDENTITY, dtype=np.uint8)
+
+    frontier = np.asarray(roots, dtype=np.int64)
+    core = 1
+    while len(frontier):
+        grid = children[frontier]
+        index, slot = np.nonzero(grid != NONE)
+        parent, child = frontier[index], grid[index, slot]
+        parent_rotation = rotation[parent]
+        position[child] = (
+            position[parent] + ROTATED_OFFSETS[parent_rotation, core, slot]
+        )
+        rotation[child] = COMPOSE[parent_rotation, CHILD_TURN[core, slot, turn[child]]]
+        frontier = child
+        core = 0
+    return position, rotation
+
+
+# =============================== Population ===================================== #
+class Population:
+    """Many Morphologies stacked into flat arrays
+
+    Attributes:
+        offsets: First row of every robot, plus the total number of rows
+        owner: Robot every row belongs to
+        part_type: Index into PART_TYPES of every row, EMPTY for unused rows
+        orientation: Orientation of every row in degrees
+        children: Rows of the children of every row, shifted to the stacked numbering
+    """
+
+    def __init__(self, morphologies) -> None:
+        sizes = [m.size for m in morphologies]
+        self.offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+        self.owner = np.repeat(np.arange(len(sizes)), sizes)
+        self.part_type = np.concatenate([m.part_type[: m.size] for m in morphologies])
+        self.orientation = np.concatenate(
+            [m.orientation[: m.size] for m in morphologies]
+        )
+        children = np.concatenate([m.children[: m.size] for m in morphologies])
+        shift = np.repeat(self.offsets[:-1], sizes)[:, None]
+        self.children = np.where(children != NONE, children + shift, NONE)
+
+    @classmethod
+    def from_arrays(cls, sizes, parent, slot, part_type, orientation) -> "Population":
+        """
+        Args:
+            sizes: Number of parts of every robot
+            parent: Index of the parent of every part within its robot, NONE for the
+                cores, which must come first in every robot
+            slot: Slot of the parent every part is attached to
+            part_type: Index into PART_TYPES of every part
+            orientation: Orientation of every part in degrees
+
+        Returns: the Population, with the parts stacked in the order given (e.g. the
+        nodes of an archive), without building any Morphology
+        """
+        self = cls.__new__(cls)
+        self.offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+        self.owner = np.repeat(np.arange(len(sizes)), sizes)
+        self.part_type = np.asarray(part_type, dtype=np.uint8)
+        self.orientation = np.asarray(orientation, dtype=np.uint8)
+        self.children = np.full((len(self.owner), SLOTS), NONE, dtype=np.int64)
+        parent = np.asarray(parent, dtype=np.int64)
+        child = np.flatnonzero(parent != NONE)
+        shift = self.offsets[self.owner[child]]
+        self.children[parent[child] + shift, np.asarray(slot)[child]] = child
+        return self
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def roots(self) -> np.array:
+        return self.offsets[:-1] + ROOT
+
+    @property
+    def alive(self) -> np.array:
+        return self.part_type != EMPTY
+
+    def forward(self) -> tuple:
+        """Returns: lattice cells and rotation indices of every row, see forward()"""
+        return forward(self.children, self.orientation, self.roots)
+
+    def split(self, values) -> list:
+        """
+        Args:
+            values: Per row array, e.g. the positions returned by forward
+
+        Returns: one view per robot
+        """
+        return np.split(values, self.offsets[1:-1])
+
+    def overlapping(self, position=None) -> np.array:
+        """
+        Args:
+            position: Cells returned by forward, computed if not given
+
+        Returns: (len(self),) bool, whether two parts of the robot share a cell
+        """
+        if position is None:
+            position, _ = self.forward()
+        alive = self.alive
+        owner = self.owner[alive]
+        keys = pack_array(position[alive])
+        order = np.lexsort((keys, owner))
+        owner, keys = owner[order], keys[order]
+        clash = (owner[1:] == owner[:-1]) & (keys[1:] == keys[:-1])
+        result = np.zeros(len(self), dtype=bool)
+        result[owner[1:][clash]] = True
+        return result
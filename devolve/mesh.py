@@ -0,0 +1,122 @@
+""" Mesh simplification for the part models
+
+Works on plain NumPy arrays (vertex positions, texture coordinates and triangle indices)
+so the level-of-detail meshes can be generated without a graphics context.
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# =============================== Constants ===================================== #
+UV_CELLS = 16
+"""int: module level constant
+Resolution of the grid used to keep vertices of different texture islands apart
+"""
+
+BOX_FACES = np.array(
+    [
+        [[0, 0, 0], [0, 0, 1], [0, 1, 1], [0, 1, 0]],  # -x
+        [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1]],  # +x
+        [[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1]],  # -y
+        [[0, 1, 0], [0, 1, 1], [1, 1, 1], [1, 1, 0]],  # +y
+        [[0, 0, 0], [0, 1, 0], [1, 1, 0], [1, 0, 0]],  # -z
+        [[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],  # +z
+    ]
+)
+"""np.array: module level constant
+Corners of the faces of a unit box (0 = minimum, 1 = maximum of the bounds), wound
+counter-clockwise when seen from outside
+"""
+
+
+# =============================== Simplification ===================================== #
+def cluster(vertices, uvs, triangles, cells: int):
+    """
+    Merges the vertices that fall in the same cell of a regular grid.
+
+    Args:
+        vertices: (n, 3) vertex positions
+        uvs: (n, 2) texture coordinates
+        triangles: (m, 3) vertex indices
+        cells: Number of grid cells along the longest side of the bounding box
+
+    Returns: (vertices, uvs, triangles) of the simplified mesh
+    """
+    low = vertices.min(axis=0)
+    extent = max(float((vertices.max(axis=0) - low).max()), 1e-9)
+    keys = np.floor((vertices - low) / (extent / cells)).astype(np.int64)
+    keys = np.minimum(keys, cells - 1)
+    uv_keys = np.floor(np.mod(uvs, 1.0) * UV_CELLS).astype(np.int64)
+    keys = np.concatenate([keys, uv_keys], axis=1)
+    _, labels = np.unique(keys, axis=0, return_inverse=True)
+    labels = labels.reshape(-1)
+
+    # Average position and texture coordinate of every cluster
+    counts = np.bincount(labels).astype(np.float64)[:, None]
+    new_vertices = np.stack(
+        [np.bincount(labels, weights=vertices[:, i]) for i in range(3)], axis=1
+    )
+    new_uvs = np.stack(
+        [np.bincount(labels, weights=uvs[:, i]) for i in range(2)], axis=1
+    )
+
+    # Drop the triangles that collapsed and the ones that became duplicates
+    new_triangles = labels[triangles]
+    a, b, c = new_triangles.T
+    new_triangles = new_triangles[(a != b) & (b != c) & (a != c)]
+    order = np.sort(new_triangles, axis=1)
+    _, first = np.unique(order, axis=0, return_index=True)
+    new_triangles = new_triangles[np.sort(first)]
+    return (
+        (new_vertices / counts).astype(np.float32),
+        (new_uvs / counts).astype(np.float32),
+        new_triangles.astype(np.int32),
+    )
+
+
+def decimate(vertices, uvs, triangles, ratio: float):
+    """
+    Simplifies a mesh by vertex clustering until it has about `ratio` of its triangles.
+
+    Args:
+        vertices: (n, 3) vertex positions
+        uvs: (n, 2) texture coordinates
+        triangles: (m, 3) vertex indices
+        ratio: Fraction of the triangles to keep, range = (0-1]
+
+    Returns: (vertices, uvs, triangles) of the simplified mesh
+    """
+    target = max(int(len(triangles) * ratio), 12)
+    if target >= len(triangles):
+        return vertices, uvs, triangles
+
+    # Bisect the grid resolution, finer grids keep more triangles
+    low, high = 1, 1024
+    best = cluster(vertices, uvs, triangles, low)
+    while high - low > 1:
+        cells = (low + high) // 2
+        mesh = cluster(vertices, uvs, triangles, cells)
+        if len(mesh[2]) <= target:
+            low, best = cells, mesh
+        else:
+            high = cells
+    return best
+
+
+def box_proxy(vertices):
+    """
+    Args:
+        vertices: (n, 3) vertex positions
+
+    Returns: (vertices, uvs, triangles) of the bounding box of the vertices
+    """
+    low, high = vertices.min(axis=0), vertices.max(axis=0)
+    corners = BOX_FACES.reshape(-1, 3)
+    box_vertices = np.where(corners == 1, high, low).astype(np.float32)
+    box_uvs = np.tile([[0, 0], [1, 0], [1, 1], [0, 1]], (len(BOX_FACES), 1))
+    quads = np.arange(len(corners)).reshape(-1, 4)
+    box_triangles = np.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+    # Fancy indexing the columns gives Fortran order, the GPU buffers need C order
+    box_triangles = np.ascontiguousarray(box_triangles, dtype=np.int32)
+    return box_vertices, box_uvs.astype(np.float32), box_triangles
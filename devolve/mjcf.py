@@ -0,0 +1,233 @@
+""" MuJoCo export of robots
+
+Writes a Morphology as MJCF: every part is a body (the core with a free joint) with a box
+filling its lattice cell, hinges add a hinge joint on the face they share with their
+parent, driven by a position actuator. Bodies are not rotated, so their offsets are the
+lattice offsets and the hinge axes are read off the part frames of devolve.geometry:
+local x for orientation 0, which orientation 90 turns to local z.
+
+Compiled models are cached by model hash, so robots seen before skip both the XML
+generation and the compilation. The hash covers exactly what to_mjcf writes apart from
+names and colors: the parts in pre-order with their cells and, for hinges, the signed
+hinge axis and face. Robots with the same model hash have the same joints and actuators,
+in the same order, so a control vector means the same for all of them. Robots that are
+only equivalent under a symmetry of the core (devolve.canonical) get their own models:
+their actuators come in another order and their hinges can turn the other way.
+
+MuJoCo is optional, to_mjcf only builds text.
+
+Example:
+    >>> cache = ModelCache("mujoco_cache")
+    >>> model = cache.model(robot)
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import hashlib
+import os
+from xml.sax.saxutils import escape
+
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.canonical import HASH_SIZE
+from devolve.constants import HINGE, TYPE_INDEX
+from devolve.geometry import ROTATIONS
+from devolve.morphology import NONE, ROOT, Morphology
+
+try:
+    import mujoco
+except ImportError:
+    mujoco = None
+
+# =============================== Constants ===================================== #
+CELL = 0.06
+"""float: module level constant
+Edge of a lattice cell in meters
+"""
+
+BOX = 0.45 * CELL
+"""float: module level constant
+Half size of the part boxes, a bit less than half a cell so neighbours do not touch
+"""
+
+HINGE_AXIS = 0
+"""int: module level constant
+Column of the part frame holding the hinge axis (local x)
+"""
+
+HINGE_RANGE = 1.0472
+"""float: module level constant
+Range of motion of the hinges, +- radians (60 degrees)
+"""
+
+ACTUATOR_GAIN = 2.0
+"""float: module level constant
+Position gain (kp) of the hinge actuators
+"""
+
+HEADER = f"""<mujoco model="{{name}}">
+  <option timestep="0.005"/>
+  <default>
+    <geom type="box" size="{BOX:g} {BOX:g} {BOX:g}" friction="1 0.005 0.0001"/>
+    <joint type="hinge" range="-{HINGE_RANGE:g} {HINGE_RANGE:g}" damping="0.05"/>
+    <position kp="{ACTUATOR_GAIN:g}" ctrlrange="-{HINGE_RANGE:g} {HINGE_RANGE:g}"/>
+  </default>
+  <worldbody>
+    <light pos="0 0 3" dir="0 0 -1"/>
+    <geom name="floor" type="plane" size="0 0 0.05" rgba="0.8 0.8 0.8 1"/>
+"""
+"""string: module level constant
+Start of every model, up to the bodies of the robot
+"""
+
+
+# =============================== Export ===================================== #
+def _vector(values) -> str:
+    return " ".join(f"{v:g}" for v in values)
+
+
+def to_mjcf(morphology: Morphology) -> str:
+    """
+    Args:
+        morphology: Robot to export
+
+    Returns: MJCF text of the robot on a floor, actuators in pre-order of the hinges
+    """
+    m = morphology
+    order = m.subtree(ROOT)
+    lowest = int(m.position[order, 2].min())
+    lines = [HEADER.format(name=escape(str(m.name), {'"': "&quot;"}))]
+    actuators = []
+
+    # Depth first, with a marker to close the body of a part after its subtree
+    stack = [(ROOT, False)]
+    depth = 2
+    while stack:
+        row, close = stack.pop()
+        indent = "  " * depth
+        if close:
+            depth -= 1
+            lines.append(f"{'  ' * depth}</body>\n")
+            continue
+
+        name = m.part_id(row)
+        rgba = _vector(tuple(m.rgb(row)) + (1,))
+        if row == ROOT:
+            height = (0.5 - lowest) * CELL + 0.01
+            lines.append(f'{indent}<body name="{name}" pos="0 0 {height:g}">\n')
+            lines.append(f'{indent}  <freejoint name="root"/>\n')
+        else:
+            offset = (m.position[row] - m.position[m.parent[row]]) * CELL
+            lines.append(f'{indent}<body name="{name}" pos="{_vector(offset)}">\n')
+        if m.part_type[row] == TYPE_INDEX[HINGE]:
+            frame = ROTATIONS[m.rotation[row]]
+            axis = frame[:, HINGE_AXIS]
+            face = -frame[:, 1] * CELL / 2  # Local y points away from the parent
+            lines.append(
+                f'{indent}  <joint name="{name}" pos="{_vector(face)}" '
+                f'axis="{_vector(axis)}"/>\n'
+            )
+            actuators.append(f'    <position name="{name}" joint="{name}"/>\n')
+        lines.append(f'{indent}  <geom name="{name}" rgba="{rgba}"/>\n')
+
+        depth += 1
+        stack.append((row, True))
+        stack.extend((c, False) for _, c in m.child_items(row)[::-1])
+
+    lines.append("  </worldbody>\n")
+    if actuators:
+        lines.append("  <actuator>\n")
+        lines.extend(actuators)
+        lines.append("  </actuator>\n")
+    lines.append("</mujoco>\n")
+    return "".join(lines)
+
+
+def model_hash(morphology: Morphology) -> str:
+    """
+    Args:
+        morphology: Robot to hash
+
+    Returns: hex digest of everything to_mjcf writes but names and colors, the same
+    for robots that compile to the same model
+    """
+    m = morphology
+    order = np.array(m.subtree(ROOT))
+    index = np.full(m.size, NONE, dtype=np.int64)
+    index[order] = np.arange(len(order))
+    parent = m.parent[order]
+    hinge = (m.part_type[order] == TYPE_INDEX[HINGE])[:, None]
+    frame = ROTATIONS[m.rotation[order]][:, :, [HINGE_AXIS, 1]].reshape(len(order), 6)
+    table = np.hstack(
+        (
+            np.where(parent == NONE, NONE, index[parent])[:, None],
+            m.position[order],
+            m.part_type[order, None],
+            frame * hinge,
+        )
+    ).astype("<i4")
+    digest = hashlib.blake2b(HEADER.encode(), digest_size=HASH_SIZE, person=b"mjcf")
+    digest.update(table.tobytes())
+    return digest.hexdigest()
+
+
+# =============================== Model cache ===================================== #
+class ModelCache:
+    """Compiled MuJoCo models by model hash
+
+    Attributes:
+        directory: Folder keeping the compiled models (.mjb) between runs, None to only
+            keep them in memory
+        models: Model hash -> MjModel
+        hits: Number of models returned without compiling
+        misses: Number of models compiled
+    """
+
+    def __init__(self, directory=None) -> None:
+        if mujoco is None:
+            raise ImportError("The MuJoCo export needs the mujoco package")
+        self.directory = directory
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self.models)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.mjb")
+
+    def get(self, digest: str):
+        """Returns: the model with this model hash, None if it was never compiled"""
+        model = self.models.get(digest)
+        if model is None and self.directory is not None:
+            if os.path.exists(self.path(digest)):
+                model = self.models[digest] = mujoco.MjModel.from_binary_path(
+                    self.path(digest)
+                )
+        return model
+
+    def model(self, morphology: Morphology, digest=None):
+        """
+        Args:
+            morphology: Robot to simulate
+            digest: Its model hash, if already known
+
+        Returns: the compiled model of the robot (or of one with the same model hash)
+        """
+        digest = digest or model_hash(morphology)
+        model = self.get(digest)
+        if model is not None:
+            self.hits += 1
+            return model
+        self.misses += 1
+        model = self.models[digest] = mujoco.MjModel.from_xml_string(
+            to_mjcf(morphology)
+        )
+        if self.directory is not None:
+            mujoco.mj_saveModel(model, self.path(digest), None)
+        return model
@@ -0,0 +1,654 @@
+"""Headless robot body
+
+A Morphology stores a robot as a struct-of-arrays: one row per part, with the parent row,
+the slot of the parent the part is attached to, its type, orientation and color kept in
+NumPy arrays. It does not know anything about Ursina, so robots can be loaded, queried,
+edited and saved on machines without a display.
+
+Rows are never moved: removing a part marks its row as EMPTY (keeping the rest of the row
+so it can be restored), so row numbers can be used as stable part handles (e.g. by the
+editor Voxels). Once a removed row can not come back it is released and handed out again
+to the next new part.
+
+Part ids ('{type}{orientation}_{serial}') come from per-type allocators owned by the
+Morphology, released serials are reused and renumber() makes them deterministic again.
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.constants import (
+    BLUE,
+    BODY,
+    CHILDREN,
+    CORE,
+    GREEN,
+    ID,
+    ORIENTATION,
+    ORIENTATIONS,
+    PARAMS,
+    PART_COLORS,
+    PART_TYPES,
+    RED,
+    SLOTS,
+    TYPE,
+    TYPE_INDEX,
+)
+from devolve.geometry import (
+    CHILD_TURN,
+    COMPOSE,
+    IDENTITY,
+    ROTATED_OFFSETS,
+    attach,
+    orientation_index,
+)
+from devolve.ids import IdAllocator
+from devolve.occupancy import Occupancy
+
+# =============================== Constants ===================================== #
+NONE = -1
+"""int: module level constant
+Marker for "no part" in the parent and children arrays
+"""
+
+EMPTY = 255
+"""int: module level constant
+Marker in the part_type array for rows that do not hold a part
+"""
+
+ROOT = 0
+"""int: module level constant
+Row of the core component, every Morphology has one
+"""
+
+COLUMNS = {
+    "parent": (np.int32, (), NONE),
+    "slot": (np.uint8, (), 0),
+    "part_type": (np.uint8, (), EMPTY),
+    "orientation": (np.uint8, (), 0),
+    "color": (np.uint16, (), 0),
+    "serial": (np.int32, (), 0),
+    "children": (np.int32, (SLOTS,), NONE),
+    "position": (np.int32, (3,), 0),
+    "rotation": (np.uint8, (), IDENTITY),
+    "version": (np.int64, (), 0),
+}
+"""dict: module level constant
+Per-part arrays of a Morphology: name -> (dtype, shape of one row, fill value)
+"""
+
+_OFFSETS, _COMPOSE, _TURNS = (
+    ROTATED_OFFSETS.tolist(),
+    COMPOSE.tolist(),
+    CHILD_TURN.tolist(),
+)
+
+
+class MorphologyError(ValueError):
+    """Raised when a robot description or an edit breaks the Morphology rules"""
+
+
+# =============================== Morphology ===================================== #
+class Morphology:
+    """Robot body stored as parallel NumPy arrays
+
+    Attributes:
+        name: Identifier of the robot, written as the top level YAML id
+        parent: Row of the parent part, NONE for the core
+        slot: Slot of the parent the part is attached to
+        part_type: Index into PART_TYPES, EMPTY for unused rows
+        orientation: Orientation of the part in degrees, one of ORIENTATIONS
+        color: Index into palette
+        serial: Per-type number used to build the part id
+        children: Row of the child attached to each slot, NONE if the slot is free
+        position: Lattice cell of the part, relative to the core
+        rotation: Frame of the part, index in geometry.ROTATIONS
+        version: Edit counter of the last change in the subtree of the part
+        palette: List of (red, green, blue) tuples referenced by color
+        occupancy: Index of the cells taken by the parts
+    """
+
+    def __init__(self, name="robot", capacity: int = 16) -> None:
+        self.name = name
+        self.palette = []
+        self._palette_index = {}
+        self._rows = IdAllocator(start=0)
+        self._serials = [IdAllocator() for _ in PART_TYPES]
+        self._version = 0
+        self.occupancy = Occupancy()
+        self._allocate(max(capacity, 1))
+        self._new_row(NONE, 0, TYPE_INDEX[CORE], 0, PART_COLORS[0][CORE])
+        self.occupancy.add((0, 0, 0), ROOT)
+
+    # ======== STORAGE ======== #
+    def _allocate(self, capacity: int) -> None:
+        for name, (dtype, shape, fill) in COLUMNS.items():
+            column = np.full((capacity,) + shape, fill, dtype=dtype)
+            if hasattr(self, name):
+                old = getattr(self, name)
+                column[: len(old)] = old
+            setattr(self, name, column)
+
+    def _new_row(self, parent, slot, part_type, orientation, rgb) -> int:
+        if parent != NONE:
+            cell, rotation = attach(
+                self.position[parent],
+                self.rotation[parent],
+                parent == ROOT,
+                slot,
+                orientation,
+            )
+            if tuple(cell) in self.occupancy:
+                taken = self.occupancy.get(cell)
+                cell = tuple(int(c) for c in cell)
+                raise MorphologyError(f"Cell {cell} is already taken by part {taken}")
+        row = self._rows.allocate()
+        if row == len(self.parent):
+            self._allocate(2 * len(self.parent))
+        self.parent[row] = parent
+        self.slot[row] = slot
+        self.part_type[row] = part_type
+        self.orientation[row] = orientation
+        self.color[row] = self.color_index(rgb)
+        self.serial[row] = self._serials[part_type].allocate()
+        self.children[row] = NONE
+        if parent != NONE:
+            self.children[parent, slot] = row
+            self.position[row] = cell
+            self.rotation[row] = rotation
+            self.occupancy.add(cell, row)
+        self.touch(row)
+        return row
+
+    def touch(self, row: int) -> None:
+        """Marks a part, and every part it hangs from, as changed (see version)"""
+        self._version += 1
+        while row != NONE:
+            self.version[row] = self._version
+            row = self.parent[row]
+
+    def color_index(self, rgb) -> int:
+        """
+        Args:
+            rgb: (red, green, blue) tuple
+
+        Returns: index of the color in the palette, adding it if needed
+        """
+        rgb = tuple(rgb)
+        try:
+            return self._palette_index[rgb]
+        except KeyError:
+            self._palette_index[rgb] = len(self.palette)
+            self.palette.append(rgb)
+            return self._palette_index[rgb]
+
+    def release(self, rows) -> None:
+        """
+        Args:
+            rows: Removed rows that will never be restored, their storage is reused
+        """
+        for row in rows:
+            if row == ROOT or self.is_part(row):
+                raise MorphologyError(f"Part {row} is still in use")
+            self._rows.release(row)
+
+    # ======== QUERIES ======== #
+    @property
+    def size(self) -> int:
+        """Number of rows in use, including the removed ones"""
+        return self._rows.next
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.part_type[: self.size] != EMPTY))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the part arrays"""
+        return sum(getattr(self, name).nbytes for name in COLUMNS)
+
+    def is_part(self, row: int) -> bool:
+        return 0 <= row < self.size and self.part_type[row] != EMPTY
+
+    def type_name(self, row: int) -> str:
+        return PART_TYPES[self.part_type[row]]
+
+    def rgb(self, row: int) -> tuple:
+        return self.palette[self.color[row]]
+
+    def part_id(self, row: int) -> str:
+        """Identifier of a part, in the '{type}{orientation}_{serial}' form used by Devolve"""
+        return f"{self.type_name(row)}{self.orientation[row]}_{self.serial[row]}"
+
+    def child_items(self, row: int) -> list:
+        """
+        Args:
+            row: Part whose children to return
+
+        Returns: (slot, child row) pairs of the occupied slots, in slot order
+        """
+        return [(s, int(c)) for s, c in enumerate(self.children[row]) if c != NONE]
+
+    def child_cell(self, row: int, slot: int) -> tuple:
+        """
+        Args:
+            row: Part to attach to
+            slot: Slot of the part
+
+        Returns: lattice cell a child attached to that slot would fill
+        """
+        core = int(row == ROOT)
+        cell = self.position[row] + ROTATED_OFFSETS[self.rotation[row], core, slot]
+        return tuple(int(c) for c in cell)
+
+    def can_attach(self, row: int, slot: int) -> bool:
+        """
+        Args:
+            row: Part to attach to
+            slot: Slot of the part
+
+        Returns: whether the slot is free and its cell is not taken by another part
+        """
+        return (
+            self.is_part(row)
+            and self.children[row, slot] == NONE
+            and self.child_cell(row, slot) not in self.occupancy
+        )
+
+    def subtree(self, row: int = ROOT) -> list:
+        """
+        Args:
+            row: Root of the subtree
+
+        Returns: rows of the subtree in depth first pre-order (children in slot order)
+        """
+        order = []
+        stack = [row]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(int(c) for c in self.children[current][::-1] if c != NONE)
+        return order
+
+    # ======== EDITING ======== #
+    def add_part(
+        self, parent: int, slot: int, _type: str, orientation: int = 0, rgb=None
+    ) -> int:
+        """
+        Args:
+            parent: Row of the part to attach to
+            slot: Slot of the parent to attach to
+            _type: Type of component, one of PART_TYPES (except the core)
+            orientation: Rotation of component, one of ORIENTATIONS
+            rgb: Color of the part, defaults to PART_COLORS
+
+        Returns: row of the new part
+        """
+        if not self.is_part(parent):
+            raise MorphologyError(f"Part {parent} does not exist")
+        if _type not in TYPE_INDEX or _type == CORE:
+            raise MorphologyError(f"Invalid part type: {_type}")
+        if orientation not in ORIENTATIONS:
+            raise MorphologyError(f"Invalid orientation: {orientation}")
+        if not 0 <= slot < SLOTS:
+            raise MorphologyError(f"Invalid slot: {slot}")
+        if self.children[parent, slot] != NONE:
+            raise MorphologyError(f"Slot {slot} of part {parent} is already taken")
+        if rgb is None:
+            rgb = PART_COLORS[orientation][_type]
+        return self._new_row(parent, slot, TYPE_INDEX[_type], orientation, rgb)
+
+    def remove_subtree(self, row: int) -> list:
+        """
+        Args:
+            row: Part to remove together with everything attached to it
+
+        Returns: removed rows, in pre-order
+        """
+        if row == ROOT:
+            raise MorphologyError("The core component can not be removed")
+        if not self.is_part(row):
+            raise MorphologyError(f"Part {row} does not exist")
+        removed = self.subtree(row)
+        for part in removed:
+            self.occupancy.remove(self.position[part])
+            self._serials[self.part_type[part]].release(self.serial[part])
+        self.children[self.parent[row], self.slot[row]] = NONE
+        self.part_type[removed] = EMPTY
+        self.touch(self.parent[row])
+        return removed
+
+    def restore_subtree(self, row: int, types) -> list:
+        """
+        Puts back a subtree taken off by remove_subtree, the removed rows keep their
+        parent, children, cell and frame so this does not rebuild anything
+
+        Args:
+            row: Root of the removed subtree
+            types: Part types of the subtree rows, in pre-order
+
+        Returns: restored rows, in pre-order
+        """
+        parent, slot = int(self.parent[row]), int(self.slot[row])
+        if self.is_part(row) or not self.is_part(parent):
+            raise MorphologyError(f"Part {row} can not be restored")
+        if self.children[parent, slot] != NONE:
+            raise MorphologyError(f"Slot {slot} of part {parent} is already taken")
+        restored = self.subtree(row)
+        for part in restored:
+            if tuple(self.position[part]) in self.occupancy:
+                raise MorphologyError(f"Part {row} can not be restored, cell taken")
+        for part, part_type in zip(restored, types):
+            self.occupancy.add(self.position[part], part)
+            self.serial[part] = self._serials[part_type].allocate()
+        self.part_type[restored] = types
+        self.children[parent, slot] = row
+        self.touch(parent)
+        self.version[restored] = self._version
+        return restored
+
+    def delete_subtree(self, row: int) -> list:
+        """remove_subtree, without the option to restore: the rows are released"""
+        removed = self.remove_subtree(row)
+        self.release(removed)
+        return removed
+
+    def renumber(self) -> list:
+        """
+        Numbers the parts of every type 1, 2, 3... in pre-order, the order a freshly
+        loaded robot gets, so the ids no longer depend on the editing history
+
+        Returns: rows whose id changed
+        """
+        order = np.array(self.subtree(ROOT))
+        types = self.part_type[order]
+        serial = np.zeros(len(order), dtype=self.serial.dtype)
+        for part_type, allocator in enumerate(self._serials):
+            mask = types == part_type
+            serial[mask] = np.arange(1, np.count_nonzero(mask) + 1)
+            allocator.reset(np.count_nonzero(mask))
+        changed = order[self.serial[order] != serial].tolist()
+        self.serial[order] = serial
+        for row in changed:
+            self.touch(row)
+        return changed
+
+    def clear(self) -> None:
+        """Removes everything but the core component"""
+        for _, child in self.child_items(ROOT):
+            self.remove_subtree(child)
+
+    def merge(self, other: "Morphology") -> list:
+        """
+        Attaches the parts of another robot to the core of this one. Parts whose slot or
+        cell is already taken are skipped, together with everything attached to them.
+
+        Args:
+            other: Robot to copy the parts from
+
+        Returns: rows of the copied core children
+        """
+        grafted = []
+        for _, child in other.child_items(ROOT):
+            row = self.graft(other, child, ROOT)
+            if row != NONE:
+                grafted.append(row)
+        return grafted
+
+    def graft(self, other: "Morphology", row: int, parent: int) -> int:
+        """
+        Attaches a copy of a subtree of another robot to a part of this one, on the slot
+        the subtree hangs from in the other robot. Parts whose slot or cell is already
+        taken are skipped, together with everything attached to them.
+
+        Args:
+            other: Robot to copy the parts from
+            row: Root of the subtree in the other robot
+            parent: Part of this robot to attach the copy to
+
+        Returns: row of the copied root, NONE if it was skipped
+        """
+        root = NONE
+        stack = [(row, parent)]
+        while stack:
+            src, dst_parent = stack.pop()
+            if not self.can_attach(dst_parent, other.slot[src]):
+                continue
+            dst = self._new_row(
+                dst_parent,
+                other.slot[src],
+                other.part_type[src],
+                other.orientation[src],
+                other.rgb(src),
+            )
+            if src == row:
+                root = dst
+            stack.extend((c, dst) for _, c in other.child_items(src)[::-1])
+        return root
+
+    def restyle(self, row: int, part_type: int, color: int) -> None:
+        """
+        Changes the type and color of a part in place, the parts attached to it stay
+        where they are (their cells only depend on whether the parent is the core)
+
+        Args:
+            row: Part to change
+            part_type: Index into PART_TYPES of its new type
+            color: Index into palette of its new color
+        """
+        if not self.is_part(row):
+            raise MorphologyError(f"Part {row} does not exist")
+        if (row == ROOT) != (part_type == TYPE_INDEX[CORE]):
+            raise MorphologyError(
+                f"Part {row} can not become a {PART_TYPES[part_type]}"
+            )
+        if part_type != self.part_type[row]:
+            self._serials[self.part_type[row]].release(self.serial[row])
+            self.serial[row] = self._serials[part_type].allocate()
+            self.part_type[row] = part_type
+        self.color[row] = color
+        self.touch(row)
+
+    # ======== YAML ======== #
+    def part_dict(self, row: int) -> dict:
+        """
+        Args:
+            row: Part to describe
+
+        Returns: dictionary with correctly formatted keys for YAML file
+        """
+        red, green, blue = self.rgb(row)
+        part = {}
+        part[ID] = self.part_id(row)
+        part[TYPE] = self.type_name(row)
+        part[ORIENTATION] = int(self.orientation[row])
+        part[PARAMS] = {}
+        part[PARAMS][RED] = red
+        part[PARAMS][GREEN] = green
+        part[PARAMS][BLUE] = blue
+        return part
+
+    def body_dict(self, row: int = ROOT) -> dict:
+        """
+        Args:
+            row: Root of the subtree to describe
+
+        Returns: nested dictionary of the subtree in the Revolve YAML layout
+        """
+        root = self.part_dict(row)
+        stack = [(row, root)]
+        while stack:
+            current, data = stack.pop()
+            items = self.child_items(current)
+            if items:
+                data[CHILDREN] = {}
+                for slot, child in items:
+                    data[CHILDREN][slot] = self.part_dict(child)
+                    stack.append((child, data[CHILDREN][slot]))
+        return root
+
+    def to_dict(self) -> dict:
+        """
+        Returns: dictionary of the whole robot, ready for yaml.dump(sort_keys=False)
+        """
+        return {ID: self.name, BODY: self.body_dict()}
+
+    @classmethod
+    def from_arrays(
+        cls, name, parent, slot, part_type, orientation, color, palette
+    ) -> "Morphology":
+        """
+        Builds a robot in bulk, checking all the rules (types, slots, orientations,
+        overlaps) on whole arrays instead of part by part
+
+        Args:
+            name: Identifier of the robot
+            parent: Index of the parent of every part, the core first with parent NONE,
+                every parent before its children (e.g. pre-order)
+            slot: Slot of the parent every part is attached to
+            part_type: Index into PART_TYPES of every part
+            orientation: Orientation of every part in degrees
+            color: Index into palette of every part
+            palette: List of (red, green, blue) tuples
+
+        Returns: A Morphology with the parts in rows 0, 1, 2... in the given order
+        """
+        parent, slot, part_type, orientation, color = (
+            np.asarray(column, dtype=np.int64)
+            for column in (parent, slot, part_type, orientation, color)
+        )
+        n = len(parent)
+        index = np.arange(n)
+        if not n or parent[ROOT] != NONE or part_type[ROOT] != TYPE_INDEX[CORE]:
+            raise MorphologyError(f"The body must start with a {CORE}")
+        bad = (
+            (parent[1:] < 0)
+            | (parent[1:] >= index[1:])
+            | (part_type[1:] == TYPE_INDEX[CORE])
+            | (part_type[1:] >= len(PART_TYPES))
+            | (slot[1:] >= SLOTS)
+            | (slot[1:] < 0)
+            | ~(orientation[1:, None] == ORIENTATIONS).any(axis=1)
+        )
+        if bad.any():
+            raise MorphologyError(f"Malformed part number {int(np.argmax(bad)) + 1}")
+        if ((color < 0) | (color >= len(palette))).any():
+            raise MorphologyError("Color index out of the palette")
+        edges = parent[1:] * SLOTS + slot[1:]
+        if len(np.unique(edges)) != len(edges):
+            raise MorphologyError("Two parts are attached to the same slot")
+
+        morphology = cls(name=name, capacity=n)
+        morphology.palette = [tuple(rgb) for rgb in palette]
+        morphology._palette_index = {}
+        for i, rgb in enumerate(morphology.palette):
+            morphology._palette_index.setdefault(rgb, i)
+        morphology.parent[:n] = parent
+        morphology.slot[:n] = slot
+        morphology.part_type[:n] = part_type
+        morphology.orientation[:n] = orientation
+        morphology.color[:n] = color
+        morphology.children[parent[1:], slot[1:]] = index[1:]
+        position, rotation = _place(parent, slot, orientation)
+        morphology.position[:n] = position
+        morphology.rotation[:n] = rotation
+        morphology.occupancy.clear()
+        try:
+            morphology.occupancy.add_array(position, index)
+        except KeyError as error:
+            raise MorphologyError(error.args[0])
+
+        morphology._rows.reset(n)
+        for t, allocator in enumerate(morphology._serials):
+            mask = part_type == t
+            morphology.serial[:n][mask] = np.arange(1, np.count_nonzero(mask) + 1)
+            allocator.reset(np.count_nonzero(mask))
+        morphology.touch(ROOT)
+        morphology.version[:n] = morphology._version
+        return morphology
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Morphology":
+        """
+        Args:
+            data: Contents of a Revolve/Devolve YAML file
+
+        Returns: A Morphology holding the body of the robot
+        """
+        try:
+            body = data[BODY]
+        except (KeyError, TypeError):
+            raise MorphologyError(f"Missing '{BODY}' section")
+        if not isinstance(body, dict) or body.get(TYPE) != CORE:
+            raise MorphologyError(f"The body must start with a {CORE}")
+
+        # Flatten the nested parts in pre-order, then build everything at once
+        palette = {_part_rgb(body, CORE, 0): 0}
+        columns = [[NONE], [0], [TYPE_INDEX[CORE]], [0], [0]]
+        parent, slot, part_type, orientation, color = columns
+        stack = [(child, ROOT, s) for s, child in _child_items(body)[::-1]]
+        while stack:
+            node, node_parent, node_slot = stack.pop()
+            try:
+                node_type, node_orientation = (
+                    TYPE_INDEX.get(node[TYPE]),
+                    node[ORIENTATION],
+                )
+            except (KeyError, TypeError, AttributeError):
+                raise MorphologyError(f"Malformed part: {node!r}")
+            if node_type is None or node_type == TYPE_INDEX[CORE]:
+                raise MorphologyError(f"Invalid part type: {node[TYPE]!r}")
+            if node_orientation not in ORIENTATIONS:
+                raise MorphologyError(f"Invalid orientation: {node_orientation!r}")
+            rgb = _part_rgb(node, node[TYPE], node_orientation)
+            node_color = palette.setdefault(rgb, len(palette))
+            row = len(parent)
+            parent.append(node_parent)
+            slot.append(node_slot)
+            part_type.append(node_type)
+            orientation.append(node_orientation)
+            color.append(node_color)
+            stack.extend((c, row, s) for s, c in _child_items(node)[::-1])
+        return cls.from_arrays(data.get(ID, "robot"), *columns, list(palette))
+
+
+def _place(parent, slot, orientation) -> tuple:
+    """Cells and frames of parts given parents first, one pass over plain lists (cheaper
+    than kinematics.forward for a single robot)"""
+    turns = orientation_index(orientation).tolist()
+    position = [(0, 0, 0)] * len(parent)
+    rotation = [IDENTITY] * len(parent)
+    for i, (p, s) in enumerate(zip(parent.tolist(), slot.tolist())):
+        if p == NONE:
+            continue
+        core, r = int(p == ROOT), rotation[p]
+        dx, dy, dz = _OFFSETS[r][core][s]
+        x, y, z = position[p]
+        position[i] = (x + dx, y + dy, z + dz)
+        rotation[i] = _COMPOSE[r][_TURNS[core][s][turns[i]]]
+    return position, rotation
+
+
+def _child_items(part: dict) -> list:
+    children = part.get(CHILDREN) or {}
+    if not isinstance(children, dict):
+        raise MorphologyError(f"Malformed children: {children!r}")
+    for slot in children:
+        if not isinstance(slot, int):
+            raise MorphologyError(f"Invalid slot: {slot!r}")
+    return sorted(children.items())
+
+
+def _part_rgb(part: dict, _type: str, orientation: int) -> tuple:
+    """Returns: the color of a part, the PART_COLORS of its type if it has none"""
+    params = part.get(PARAMS) or {}
+    if not isinstance(params, dict):
+        raise MorphologyError(f"Malformed {PARAMS}: {params!r}")
+    if not all(channel in params for channel in (RED, GREEN, BLUE)):
+        return PART_COLORS[orientation].get(_type, PART_COLORS[0][_type])
+    rgb = params[RED], params[GREEN], params[BLUE]
+    for value in rgb:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise MorphologyError(f"Invalid color: {rgb!r}")
+    return rgb
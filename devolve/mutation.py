@@ -0,0 +1,242 @@
+""" Mutation operators on populations of genomes
+
+Every operator takes a batch of Genomes and a NumPy random generator, mutates one random
+part of every robot in a few whole-batch array operations and returns the offspring with a
+mask of the robots it changed:
+
+    add_part            attaches a new brick or hinge to a random free slot
+    remove_subtree      takes off a random part with everything attached to it
+    flip_orientation    turns a random part between orientation 0 and 90
+    swap_type           turns a random brick into a hinge or the other way around
+
+The attachment rules are the ones of the editor (devolve.geometry): any slot of the core,
+slots 1-3 of the other parts. New parts only go to cells no part of the robot takes, which
+is checked with one set membership test per free slot; flipping turns the whole subtree of
+the part, so those offspring are checked for overlaps with the batched kinematics and the
+ones that clash keep the parent's genome.
+
+Example:
+    >>> rng = np.random.default_rng(42)
+    >>> offspring = mutate(genomes.take(rng.integers(len(genomes), size=100_000)), rng)
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# Local
+from devolve.constants import BRICK, HINGE, ORIENTATIONS, TYPE_INDEX
+from devolve.genomes import Genomes
+from devolve.geometry import ROTATED_OFFSETS, orientation_index
+from devolve.morphology import NONE
+
+# =============================== Constants ===================================== #
+NEW_TYPES = np.array([TYPE_INDEX[BRICK], TYPE_INDEX[HINGE]], dtype=np.uint8)
+"""np.array: module level constant
+Part types add_part chooses from
+"""
+
+SWAPPED_TYPE = np.arange(len(TYPE_INDEX), dtype=np.uint8)
+SWAPPED_TYPE[[TYPE_INDEX[BRICK], TYPE_INDEX[HINGE]]] = (
+    TYPE_INDEX[HINGE],
+    TYPE_INDEX[BRICK],
+)
+"""np.array: module level constant
+Part type swap_type gives to every part type
+"""
+
+
+# =============================== Helpers ===================================== #
+def random_parts(genomes: Genomes, rng) -> np.array:
+    """
+    Returns: (len(genomes),) stacked index of one random part of every robot other than
+    its core, NONE for robots that are only a core
+    """
+    sizes = genomes.sizes
+    pick = (rng.random(len(genomes)) * (sizes - 1)).astype(np.int64)
+    return np.where(sizes > 1, genomes.offsets[:-1] + 1 + pick, NONE)
+
+
+def cell_keys(owner, cells, other_owner, other_cells) -> tuple:
+    """
+    Args:
+        owner, cells: Robot and lattice cell of some parts
+        other_owner, other_cells: Robot and lattice cell of other parts
+
+    Returns: one integer per part of both sets, equal for parts of the same robot in
+    the same cell
+    """
+    bound = int(max(np.abs(cells).max(initial=0), np.abs(other_cells).max(initial=0)))
+    bits = (2 * bound + 1).bit_length()
+    if len(owner) and int(owner.max()).bit_length() + 3 * bits < 63:
+        keys = [
+            np.asarray(o, dtype=np.int64) << 3 * bits
+            | (c[:, 0] + bound).astype(np.int64) << 2 * bits
+            | (c[:, 1] + bound).astype(np.int64) << bits
+            | (c[:, 2] + bound).astype(np.int64)
+            for o, c in ((owner, cells), (other_owner, other_cells))
+        ]
+        return keys[0], keys[1]
+    rows = np.vstack(
+        (np.column_stack((owner, cells)), np.column_stack((other_owner, other_cells)))
+    )
+    _, ids = np.unique(rows, axis=0, return_inverse=True)
+    ids = ids.reshape(-1)
+    return ids[: len(owner)], ids[len(owner) :]
+
+
+def copy(genomes: Genomes) -> Genomes:
+    return genomes.take(np.arange(len(genomes)))
+
+
+def _recolor(genomes: Genomes, nodes) -> None:
+    """Gives the nodes the default color of their type and orientation"""
+    colors = genomes.default_colors()
+    turn = orientation_index(genomes.orientation[nodes])
+    genomes.color[nodes] = colors[turn, genomes.part_type[nodes]]
+
+
+# =============================== Operators ===================================== #
+def add_part(genomes: Genomes, rng, types=NEW_TYPES) -> tuple:
+    """
+    Args:
+        genomes: Parents
+        rng: NumPy random generator
+        types: Part types to choose from
+
+    Returns: (offspring, mask of the robots that got a part), robots without a free slot
+    are copied as they are
+    """
+    population = genomes.population()
+    position, rotation = population.forward()
+    owner = genomes.owner
+    core = genomes.parent == NONE
+
+    # Every free slot with the cell a part attached to it would take
+    free = population.children == NONE
+    free[~core, 0] = False
+    node, slot = np.nonzero(free)
+    cell = (
+        position[node] + ROTATED_OFFSETS[rotation[node], core[node].astype(int), slot]
+    )
+
+    # Drop the slots whose cell is taken, with one membership test per slot
+    taken, wanted = cell_keys(owner, position, owner[node], cell)
+    taken.sort()
+    found = np.minimum(np.searchsorted(taken, wanted), len(taken) - 1)
+    usable = taken[found] != wanted
+    node, slot = node[usable], slot[usable]
+
+    # One random usable slot per robot, they are grouped by robot already
+    count = np.bincount(owner[node], minlength=len(genomes))
+    added = count > 0
+    first = np.cumsum(count) - count
+    pick = first + (rng.random(len(genomes)) * count).astype(np.int64)
+    node, slot = node[pick[added]], slot[pick[added]]
+    robot = owner[node]
+
+    new_type = rng.choice(np.asarray(types, dtype=np.uint8), len(node))
+    new_orientation = rng.choice(np.asarray(ORIENTATIONS, dtype=np.uint8), len(node))
+    colors = genomes.default_colors()
+
+    # New nodes go after the nodes of their robot, so parents stay before children
+    order = np.argsort(np.concatenate((owner, robot)), kind="stable")
+    sizes = genomes.sizes + added
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    offspring = Genomes(
+        offsets,
+        np.concatenate((genomes.parent, node - genomes.offsets[robot]))[order],
+        np.concatenate((genomes.slot, slot))[order],
+        np.concatenate((genomes.part_type, new_type))[order],
+        np.concatenate((genomes.orientation, new_orientation))[order],
+        np.concatenate(
+            (genomes.color, colors[orientation_index(new_orientation), new_type])
+        )[order],
+        genomes.palette,
+        genomes.names,
+    )
+    return offspring, added
+
+
+def remove_subtree(genomes: Genomes, rng) -> tuple:
+    """
+    Args:
+        genomes: Parents
+        rng: NumPy random generator
+
+    Returns: (offspring, mask of the robots that lost parts), robots that are only a
+    core are copied as they are
+    """
+    node = random_parts(genomes, rng)
+    removed = genomes.subtree_mask(node[node != NONE])
+    return genomes.keep(~removed), node != NONE
+
+
+def flip_orientation(genomes: Genomes, rng) -> tuple:
+    """
+    Args:
+        genomes: Parents
+        rng: NumPy random generator
+
+    Returns: (offspring, mask of the robots that changed), robots whose flipped part
+    would make two parts overlap are copied as they are
+    """
+    node = random_parts(genomes, rng)
+    changed = node != NONE
+    node = node[changed]
+    offspring = copy(genomes)
+    turn = orientation_index(offspring.orientation[node])
+    offspring.orientation[node] = np.asarray(ORIENTATIONS)[1 - turn]
+    _recolor(offspring, node)
+
+    clash = offspring.overlapping()
+    undo = node[clash[genomes.owner[node]]]
+    offspring.orientation[undo] = genomes.orientation[undo]
+    offspring.color[undo] = genomes.color[undo]
+    return offspring, changed & ~clash
+
+
+def swap_type(genomes: Genomes, rng) -> tuple:
+    """
+    Args:
+        genomes: Parents
+        rng: NumPy random generator
+
+    Returns: (offspring, mask of the robots that changed), robots that are only a core
+    are copied as they are
+    """
+    node = random_parts(genomes, rng)
+    changed = node != NONE
+    node = node[changed]
+    offspring = copy(genomes)
+    offspring.part_type[node] = SWAPPED_TYPE[offspring.part_type[node]]
+    _recolor(offspring, node)
+    return offspring, changed
+
+
+OPERATORS = (add_part, remove_subtree, flip_orientation, swap_type)
+"""tuple: module level constant
+Operators mutate chooses from
+"""
+
+
+def mutate(genomes: Genomes, rng, weights=None) -> Genomes:
+    """
+    Args:
+        genomes: Parents
+        rng: NumPy random generator
+        weights: Probability of every operator of OPERATORS, uniform by default
+
+    Returns: one offspring per parent, in the same order, each made by one randomly
+    chosen operator
+    """
+    choice = rng.choice(len(OPERATORS), len(genomes), p=weights)
+    robots, batches = [], []
+    for i, operator in enumerate(OPERATORS):
+        chosen = np.flatnonzero(choice == i)
+        if len(chosen):
+            robots.append(chosen)
+            batches.append(operator(genomes.take(chosen), rng)[0])
+    offspring = Genomes.concatenate(batches)
+    return offspring.take(np.argsort(np.concatenate(robots)))
@@ -0,0 +1,130 @@
+""" Sparse occupancy index of the lattice cells of a robot
+
+Cells are integer coordinates relative to the core, packed into a single integer so the
+index is a plain dict: adding, removing and testing a cell are O(1) whatever the size of
+the robot (unlike a dense grid, whose memory is cubic in its extent).
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import numpy as np
+
+# =============================== Constants ===================================== #
+BITS = 21
+"""int: module level constant
+Bits per packed coordinate, cells range from -2**20 to 2**20 - 1 on every axis
+"""
+
+BIAS = 1 << (BITS - 1)
+MASK = (1 << BITS) - 1
+
+
+def pack(x: int, y: int, z: int) -> int:
+    """Packs a cell into a single (non negative) integer key"""
+    return ((int(x) + BIAS) << (2 * BITS)) | ((int(y) + BIAS) << BITS) | (int(z) + BIAS)
+
+
+def unpack(key: int) -> tuple:
+    """Inverse of pack"""
+    return (
+        ((key >> (2 * BITS)) & MASK) - BIAS,
+        ((key >> BITS) & MASK) - BIAS,
+        (key & MASK) - BIAS,
+    )
+
+
+def pack_array(cells) -> np.array:
+    """
+    Args:
+        cells: (n, 3) integer cells
+
+    Returns: (n,) int64 keys, same values as pack
+    """
+    cells = np.asarray(cells, dtype=np.int64) + BIAS
+    return (cells[:, 0] << (2 * BITS)) | (cells[:, 1] << BITS) | cells[:, 2]
+
+
+# =============================== Occupancy ===================================== #
+class Occupancy:
+    """Maps the occupied cells of a robot to the part filling them"""
+
+    def __init__(self) -> None:
+        self.cells = {}
+        self._bounds = None
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def __contains__(self, cell) -> bool:
+        return pack(*cell) in self.cells
+
+    def get(self, cell, default=None):
+        """
+        Args:
+            cell: (x, y, z) integer cell
+            default: Returned if the cell is free
+
+        Returns: the part in the cell
+        """
+        return self.cells.get(pack(*cell), default)
+
+    def add(self, cell, part) -> None:
+        key = pack(*cell)
+        if key in self.cells:
+            raise KeyError(f"Cell {tuple(cell)} is already taken by {self.cells[key]}")
+        self.cells[key] = part
+        self._grow(np.asarray(cell).reshape(1, 3))
+
+    def add_array(self, cells, parts) -> None:
+        """
+        Args:
+            cells: (n, 3) integer cells, all free
+            parts: (n,) parts filling them
+        """
+        keys = pack_array(cells).tolist()
+        clash = set(keys).intersection(self.cells)
+        if clash or len(set(keys)) != len(keys):
+            key = clash.pop() if clash else next(k for k in keys if keys.count(k) > 1)
+            raise KeyError(f"Cell {unpack(key)} is taken twice")
+        self.cells.update(zip(keys, np.asarray(parts).tolist()))
+        self._grow(np.asarray(cells))
+
+    def remove(self, cell) -> None:
+        del self.cells[pack(*cell)]
+        self._stale = True
+
+    def clear(self) -> None:
+        self.cells.clear()
+        self._bounds = None
+        self._stale = False
+
+    def _grow(self, cells) -> None:
+        if len(cells) == 0 or self._stale:
+            return
+        lower, upper = cells.min(axis=0), cells.max(axis=0)
+        if self._bounds is not None:
+            lower = np.minimum(lower, self._bounds[0])
+            upper = np.maximum(upper, self._bounds[1])
+        self._bounds = tuple(lower.tolist()), tuple(upper.tolist())
+
+    def bounds(self):
+        """
+        Returns: ((x, y, z) lowest, (x, y, z) highest) cell coordinates of the occupied
+        cells, None if there are none. Computed again only after cells were removed.
+        """
+        if self._stale:
+            self._stale = False
+            self._bounds = None
+            if self.cells:
+                keys = np.fromiter(self.cells, dtype=np.int64, count=len(self.cells))
+                cells = np.column_stack(
+                    (keys >> (2 * BITS) & MASK, keys >> BITS & MASK, keys & MASK)
+                )
+                self._grow(cells - BIAS)
+        return self._bounds
+
+    def items(self):
+        """Yields: ((x, y, z), part) pairs of the occupied cells"""
+        for key, part in self.cells.items():
+            yield unpack(key), part
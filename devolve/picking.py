@@ -0,0 +1,110 @@
+""" Ray picking on the part lattice
+
+Every part fills the unit cube centred on its lattice cell, so the part under the mouse is
+found without any collider: the ray is clipped to the box around the occupied cells and
+walked through the lattice one cell at a time (3D DDA, Amanatides & Woo), each cell being
+looked up in the Occupancy of the robot. The walk visits only the cells the ray crosses,
+so the cost depends on the extent of the robot along the ray, not on its number of parts.
+
+The face the ray enters through gives the slot it points at, in the frame of the part.
+
+Example:
+    >>> pick(robot, origin=(0, 0, -10), direction=(0, 0, 1))
+    (0, None)
+"""
+
+# =============================== Imports ===================================== #
+# Standard
+import math
+
+# Local
+from devolve.geometry import ROTATIONS, normal_slot
+from devolve.morphology import ROOT, Morphology
+from devolve.occupancy import Occupancy
+
+
+# =============================== Functions ===================================== #
+def cast(occupancy: Occupancy, origin, direction):
+    """
+    Args:
+        occupancy: Occupied cells of a robot
+        origin: Start of the ray, in lattice coordinates
+        direction: Direction of the ray, need not be normalized
+
+    Returns: (part, cell, normal) of the first occupied cell the ray enters, normal being
+    the (x, y, z) outward normal of the face it enters through (None if the ray starts
+    inside the part), None if the ray hits nothing
+    """
+    bounds = occupancy.bounds()
+    if bounds is None:
+        return None
+    lower, upper = bounds
+    origin = [float(c) for c in origin]
+    direction = [float(c) for c in direction]
+
+    # Clip the ray to the box of the occupied cells (slab test)
+    enter, leave, axis = 0.0, math.inf, None
+    for i in range(3):
+        low, high = lower[i] - 0.5, upper[i] + 0.5
+        if direction[i] == 0:
+            if not low <= origin[i] <= high:
+                return None
+            continue
+        near = (low - origin[i]) / direction[i]
+        far = (high - origin[i]) / direction[i]
+        if near > far:
+            near, far = far, near
+        if near > enter:
+            enter, axis = near, i
+        leave = min(leave, far)
+    if enter > leave:
+        return None
+
+    # First cell, snapped into the box against rounding on its faces
+    point = [origin[i] + enter * direction[i] for i in range(3)]
+    cell = [min(max(math.floor(point[i] + 0.5), lower[i]), upper[i]) for i in range(3)]
+    if axis is not None:
+        cell[axis] = lower[axis] if direction[axis] > 0 else upper[axis]
+
+    step = [(d > 0) - (d < 0) for d in direction]
+    next_face = [
+        (
+            enter + (cell[i] + 0.5 * step[i] - point[i]) / direction[i]
+            if step[i]
+            else math.inf
+        )
+        for i in range(3)
+    ]
+    delta = [abs(1 / d) if d else math.inf for d in direction]
+    while True:
+        part = occupancy.get(cell)
+        if part is not None:
+            if axis is None:
+                return part, tuple(cell), None
+            normal = tuple(-step[axis] if i == axis else 0 for i in range(3))
+            return part, tuple(cell), normal
+        axis = min(range(3), key=next_face.__getitem__)
+        if next_face[axis] > leave:
+            return None
+        cell[axis] += step[axis]
+        next_face[axis] += delta[axis]
+
+
+def pick(morphology: Morphology, origin, direction):
+    """
+    Args:
+        morphology: Robot, in the lattice coordinates of its core
+        origin: Start of the ray
+        direction: Direction of the ray
+
+    Returns: (row of the first part hit, slot of the face hit or None), None if the ray
+    misses the robot
+    """
+    hit = cast(morphology.occupancy, origin, direction)
+    if hit is None:
+        return None
+    part, _, normal = hit
+    if normal is None:
+        return part, None
+    local = ROTATIONS[morphology.rotation[part]].T.astype(int) @ normal
+    return part, normal_slot(local, core=part == ROOT)
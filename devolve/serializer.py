@@ -0,0 +1,128 @@
+""" Incremental YAML serialization
+
+Writes a Morphology as the same text yaml_io.dump(morphology.to_dict()) would, but keeps
+the text of every subtree between saves. Every edit bumps the version of the edited part
+and of the parts it hangs from (Morphology.touch), so a save only rebuilds the fragments
+on the paths from the edited parts up to the core and reuses the rest as they are.
+
+Example:
+    >>> serializer = Serializer(robot)
+    >>> text = serializer.dump()  # Builds everything
+    >>> robot.add_part(ROOT, 3, HINGE)
+    >>> text = serializer.dump()  # Only rebuilds the core fragment
+"""
+
+# =============================== Imports ===================================== #
+# Local
+from devolve import yaml_io
+from devolve.constants import (
+    BLUE,
+    BODY,
+    CHILDREN,
+    GREEN,
+    ID,
+    ORIENTATION,
+    PARAMS,
+    RED,
+    TYPE,
+)
+from devolve.morphology import ROOT, Morphology
+
+# =============================== Constants ===================================== #
+INDENT = "  "
+"""string: module level constant
+Indentation of one nesting level, the one yaml.dump uses
+"""
+
+
+# =============================== Serializer ===================================== #
+class Serializer:
+    """Caches the YAML text of the subtrees of a Morphology
+
+    Attributes:
+        morphology: Robot to serialize
+        fragments: Row -> (version, YAML text of the subtree of the row)
+    """
+
+    def __init__(self, morphology: Morphology) -> None:
+        self.morphology = morphology
+        self.fragments = {}
+        self._scalars = {}
+
+    def scalar(self, value) -> str:
+        """Returns: value as a YAML scalar, formatted like yaml.dump does"""
+        key = type(value), value  # 1, 1.0 and True are equal keys otherwise
+        try:
+            return self._scalars[key]
+        except KeyError:
+            text = self._scalars[key] = yaml_io.dump_scalar(value)
+            return text
+
+    def part_text(self, row: int, depth: int) -> str:
+        """
+        Args:
+            row: Part to describe
+            depth: Nesting level of the part
+
+        Returns: YAML lines of the part itself, without its children
+        """
+        m = self.morphology
+        indent = INDENT * depth
+        red, green, blue = m.rgb(row)
+        return (
+            f"{indent}{ID}: {m.part_id(row)}\n"
+            f"{indent}{TYPE}: {m.type_name(row)}\n"
+            f"{indent}{ORIENTATION}: {m.orientation[row]}\n"
+            f"{indent}{PARAMS}:\n"
+            f"{indent}{INDENT}{RED}: {self.scalar(red)}\n"
+            f"{indent}{INDENT}{GREEN}: {self.scalar(green)}\n"
+            f"{indent}{INDENT}{BLUE}: {self.scalar(blue)}\n"
+        )
+
+    def fragment(self, row: int = ROOT, depth: int = 1) -> str:
+        """
+        Args:
+            row: Root of the subtree
+            depth: Nesting level of the root
+
+        Returns: YAML text of the subtree, rebuilding only the stale fragments
+        """
+        m = self.morphology
+
+        # Top down, find the parts that changed since they were last written
+        stale = []
+        stack = [(row, depth)]
+        while stack:
+            current, level = stack.pop()
+            cached = self.fragments.get(current)
+            if cached is None or cached[0] != m.version[current]:
+                stale.append((current, level))
+                stack.extend((c, level + 2) for _, c in m.child_items(current))
+
+        # Bottom up, rebuild them from the fragments of their children
+        for current, level in reversed(stale):
+            text = [self.part_text(current, level)]
+            items = m.child_items(current)
+            if items:
+                indent = INDENT * level
+                text.append(f"{indent}{CHILDREN}:\n")
+                for slot, child in items:
+                    text.append(f"{indent}{INDENT}{slot}:\n")
+                    text.append(self.fragments[child][1])
+            self.fragments[current] = (m.version[current], "".join(text))
+        return self.fragments[row][1]
+
+    def dump(self, stream=None):
+        """
+        Args:
+            stream: Open file to write to, if None the YAML text is returned
+
+        Returns: the YAML text of the whole robot if no stream was given
+        """
+        text = (
+            f"{ID}: {self.scalar(self.morphology.name)}\n"
+            f"{BODY}:\n{self.fragment(ROOT, 1)}"
+        )
+        if stream is None:
+            return text
+        stream.write(text)
@@ -0,0 +1,179 @@
+""" Fast YAML reading and writing
+
+Uses the libyaml based CSafeLoader/CSafeDumper when PyYAML was built with them, and the
+pure Python SafeLoader/SafeDumper otherwise. On top of that BodyLoader knows the shape of
+a robot description (id/type/orientation/params/children), so it builds the parts
+directly from the parsed nodes instead of going through the generic constructor.
+"""
+
+# =============================== Imports ===================================== #
+# Thirdparty
+import yaml
+
+# Local
+from devolve.constants import BODY, CHILDREN, ID, ORIENTATION, PARAMS, TYPE
+from devolve.morphology import Morphology
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+# =============================== Constants ===================================== #
+LIBYAML = SafeLoader.__name__.startswith("C")
+"""bool: module level constant
+Whether the libyaml C parser and emitter are in use
+"""
+
+INT_TAG = "tag:yaml.org,2002:int"
+FLOAT_TAG = "tag:yaml.org,2002:float"
+STR_TAG = "tag:yaml.org,2002:str"
+"""string: module level constants
+Tags of the scalars that make up a robot description
+"""
+
+RESOLVED_SIZE = 4096
+"""int: module level constant
+Most plain scalars whose implicit tag is cached, later ones are resolved every time
+"""
+
+_RESOLVED = {}
+"""dict: module level variable
+Cache of the implicit tag of plain scalars, robot files repeat the same few values a lot
+(keys, types, orientations), which are met first. Bounded by RESOLVED_SIZE, so the ids
+and colors of many files do not fill it
+"""
+
+
+# =============================== Loader ===================================== #
+class BodyLoader(SafeLoader):
+    """SafeLoader specialised for Revolve/Devolve robot descriptions
+
+    The parts of the body (and their params) are built by hand from the composed nodes,
+    everything else (e.g. the brain) goes through the regular safe constructor.
+    """
+
+    def resolve(self, kind, value, implicit):
+        if kind is not yaml.ScalarNode or not implicit[0]:
+            return super().resolve(kind, value, implicit)
+        try:
+            return _RESOLVED[value]
+        except KeyError:
+            tag = super().resolve(kind, value, implicit)
+            if len(_RESOLVED) < RESOLVED_SIZE:
+                _RESOLVED[value] = tag
+            return tag
+
+    def construct_scalar_value(self, node):
+        if node.tag == STR_TAG:
+            return node.value
+        if node.tag == INT_TAG and node.value.isdigit():
+            # Leading zeros mean octal in YAML 1.1, leave those to the constructor
+            if node.value == "0" or node.value[0] != "0":
+                return int(node.value)
+        if node.tag == FLOAT_TAG:
+            try:
+                return float(node.value)
+            except ValueError:
+                pass
+        return self.construct_object(node, deep=True)
+
+    def construct_part(self, node) -> dict:
+        if not isinstance(node, yaml.MappingNode):
+            return self.construct_object(node, deep=True)
+        part = {}
+        for key_node, value_node in node.value:
+            key = self.construct_scalar_value(key_node)
+            if key == CHILDREN and isinstance(value_node, yaml.MappingNode):
+                part[key] = {
+                    self.construct_scalar_value(k): self.construct_part(v)
+                    for k, v in value_node.value
+                }
+            elif key in (ID, TYPE, ORIENTATION) and isinstance(
+                value_node, yaml.ScalarNode
+            ):
+                part[key] = self.construct_scalar_value(value_node)
+            elif key == PARAMS and isinstance(value_node, yaml.MappingNode):
+                part[key] = {
+                    self.construct_scalar_value(k): self.construct_scalar_value(v)
+                    for k, v in value_node.value
+                    if isinstance(v, yaml.ScalarNode)
+                }
+            else:
+                part[key] = self.construct_object(value_node, deep=True)
+        return part
+
+    def get_body_data(self):
+        node = self.get_single_node()
+        if node is None:
+            return None
+        if not isinstance(node, yaml.MappingNode):
+            return self.construct_document(node)
+        data = {}
+        for key_node, value_node in node.value:
+            key = self.construct_scalar_value(key_node)
+            if key == BODY:
+                data[key] = self.construct_part(value_node)
+            else:
+                data[key] = self.construct_object(value_node, deep=True)
+        self.constructed_objects = {}
+        self.recursive_objects = {}
+        return data
+
+
+# =============================== Functions ===================================== #
+def load(stream) -> dict:
+    """
+    Args:
+        stream: YAML text or open file
+
+    Returns: the contents of the YAML document, same as yaml.safe_load
+    """
+    loader = BodyLoader(stream)
+    try:
+        return loader.get_body_data()
+    finally:
+        loader.dispose()
+
+
+def yaml_read(yaml_path: str) -> dict:
+    """
+    Args:
+        yaml_path: name of YAML file to read
+
+    Returns: A dictionary containing the contents of the YAML file
+    """
+    with open(yaml_path, "rb") as f:
+        return load(f)
+
+
+def read_morphology(yaml_path: str) -> Morphology:
+    """
+    Args:
+        yaml_path: name of YAML file to read
+
+    Returns: the body described by the YAML file
+    """
+    return Morphology.from_dict(yaml_read(yaml_path))
+
+
+def dump_scalar(value) -> str:
+    """Returns: value as a YAML scalar, formatted like yaml.dump does"""
+    return yaml.dump([value], Dumper=SafeDumper)[2:-1]
+
+
+def load_scalar(text: str):
+    """Inverse of dump_scalar"""
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def dump(data: dict, stream=None):
+    """
+    Args:
+        data: Dictionary to write, keys are kept in insertion order
+        stream: Open file to write to, if None the YAML text is returned
+
+    Returns: the YAML text if no stream was given
+    """
+    return yaml.dump(data, stream, Dumper=SafeDumper, sort_keys=False)